@@ -0,0 +1,216 @@
+import hashlib
+import mmap
+import struct
+import zipfile
+
+import cv2
+import numpy as np
+
+from instrument import recorder
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+# Local file header: signature, version, flags, compression, time, date,
+# crc, compressed size, uncompressed size, name length, extra length.
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+
+# imdecode flags for each power-of-two reduction. libjpeg applies these
+# in the DCT, so a reduced JPEG decode is several times cheaper than a full one.
+REDUCED_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+# JPEG start-of-frame markers, which carry the image size
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+_JPEG_APP1_MARKER = 0xE1
+_EXIF_ORIENTATION_TAG = 0x0112
+# EXIF orientations that turn the image by 90 degrees; imdecode applies them
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def reduction_for_scale(scale):
+    """Largest decode reduction whose output still covers a display at scale times the page size."""
+    for reduction in (8, 4, 2):
+        if scale * reduction <= 1:
+            return reduction
+    return 1
+
+
+def _exif_orientation(tiff):
+    """The orientation (1-8) in the TIFF structure of an EXIF block, 1 if it has none."""
+    order = {b"II": "<", b"MM": ">"}.get(bytes(tiff[:2]))
+    if order is None or len(tiff) < 8:
+        return 1
+    ifd = struct.unpack(order + "I", tiff[4:8])[0]
+    if ifd + 2 > len(tiff):
+        return 1
+    entry_count = struct.unpack(order + "H", tiff[ifd:ifd + 2])[0]
+    for pos in range(ifd + 2, min(ifd + 2 + 12 * entry_count, len(tiff) - 11), 12):
+        tag, _, _, value = struct.unpack(order + "HHIH", tiff[pos:pos + 10])
+        if tag == _EXIF_ORIENTATION_TAG:
+            return value
+    return 1
+
+
+def _parse_image_size(header):
+    """(height, width) from the first bytes of a JPEG or PNG file, or None.
+
+    Sizes are as imdecode returns them, after any EXIF rotation.
+    """
+    if header[:8] == b"\x89PNG\r\n\x1a\n" and len(header) >= 24:
+        width, height = struct.unpack(">II", header[16:24])
+        # An eXIf chunk, if any, comes before the image data
+        pos = 8
+        while pos + 8 <= len(header):
+            length, chunk_type = struct.unpack(">I4s", header[pos:pos + 8])
+            if chunk_type == b"eXIf":
+                if _exif_orientation(header[pos + 8:pos + 8 + length]) in _TRANSPOSED_ORIENTATIONS:
+                    return width, height
+                break
+            if chunk_type == b"IDAT":
+                break
+            pos += 12 + length
+        return height, width
+    if header[:2] != b"\xff\xd8":
+        return None
+    pos = 2
+    orientation = 1
+    while pos + 9 <= len(header):
+        if header[pos] != 0xFF:
+            return None
+        marker = header[pos + 1]
+        if marker == 0xFF:
+            pos += 1  # Fill byte
+            continue
+        length = struct.unpack(">H", header[pos + 2:pos + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", header[pos + 5:pos + 9])
+            if orientation in _TRANSPOSED_ORIENTATIONS:
+                return width, height
+            return height, width
+        if marker == _JPEG_APP1_MARKER and header[pos + 4:pos + 10] == b"Exif\0\0":
+            orientation = _exif_orientation(header[pos + 10:pos + 2 + length])
+        pos += 2 + length
+    return None
+
+
+class ComicArchive:
+    """Random-access view of the image pages inside a CBZ/ZIP archive.
+
+    Pages are listed from the zip central directory and decoded in memory,
+    nothing is extracted to disk. Stored (uncompressed) members are read
+    straight out of an mmap of the archive without copying.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._zip = zipfile.ZipFile(self._file)
+        except Exception:
+            self._file.close()
+            raise
+        self.members = sorted(
+            (info for info in self._zip.infolist()
+             if not info.is_dir() and info.filename.lower().endswith(IMAGE_EXTENSIONS)),
+            key=lambda info: info.filename,
+        )
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data_offsets = {}
+        self._page_sizes = {}
+
+    def __len__(self):
+        return len(self.members)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def name(self, index):
+        return self.members[index].filename
+
+    def crc(self, index):
+        return self.members[index].CRC
+
+    def content_hash(self):
+        """Identify the archive by its pages, from the central directory alone.
+
+        Built from member names, CRCs and sizes, so it is stable across renames
+        and copies of the file and needs no pass over the compressed data.
+        """
+        digest = hashlib.sha1()
+        for info in self.members:
+            digest.update(f"{info.filename}\0{info.CRC:08x}\0{info.file_size}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def _data_offset(self, info):
+        offset = self._data_offsets.get(info.header_offset)
+        if offset is None:
+            header = _LOCAL_HEADER.unpack_from(self._mmap, info.header_offset)
+            if header[0] != _LOCAL_HEADER_SIGNATURE:
+                raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+            name_length, extra_length = header[-2], header[-1]
+            offset = info.header_offset + _LOCAL_HEADER.size + name_length + extra_length
+            self._data_offsets[info.header_offset] = offset
+        return offset
+
+    def read(self, index):
+        """Return the raw bytes of page ``index`` as a uint8 array."""
+        info = self.members[index]
+        if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+            # Zero-copy view into the mapped archive
+            return np.frombuffer(self._mmap, dtype=np.uint8, count=info.file_size,
+                                 offset=self._data_offset(info))
+        with recorder.span("read"):
+            data = np.frombuffer(self._zip.read(info), dtype=np.uint8)
+        recorder.count("inflated_bytes", data.nbytes)
+        return data
+
+    def _header(self, index, length=65536):
+        info = self.members[index]
+        if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+            offset = self._data_offset(info)
+            return self._mmap[offset:offset + min(length, info.file_size)]
+        # Only inflate as much of the member as the header needs
+        with self._zip.open(info) as f:
+            return f.read(length)
+
+    def page_size(self, index):
+        """(height, width) of page index, read from the image header without decoding it."""
+        size = self._page_sizes.get(index)
+        if size is None:
+            size = _parse_image_size(self._header(index))
+            if size is None:
+                image = self.decode(index)
+                size = image.shape[:2] if image is not None else (0, 0)
+            self._page_sizes[index] = size
+        return size
+
+    def decode_reduced(self, index, reduction):
+        """Decode page index at 1/reduction of its size (reduction is 1, 2, 4 or 8)."""
+        return self.decode(index, REDUCED_COLOR_FLAGS[reduction])
+
+    def decode(self, index, flags=cv2.IMREAD_COLOR):
+        """Decode page ``index`` to a BGR image, or None if it is not an image."""
+        data = self.read(index)
+        if data.size == 0:
+            return None
+        with recorder.span("decode"):
+            image = cv2.imdecode(data, flags)
+        if image is not None:
+            recorder.count("decoded_bytes", image.nbytes)
+        return image
+
+    def close(self):
+        self._zip.close()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # A page buffer still references the map, it is released with it
+            pass
+        self._file.close()
@@ -0,0 +1,116 @@
+"""Compare reduced-resolution panel detection against the original 4000 px path.
+
+Usage: python benchmarks/bench_detect.py BOOK.cbz [BOOK.cbz ...] [--pages N] [--work-dim D]
+
+Decodes up to N pages from each archive, runs the original 4000 px detector
+and detect_page_boxes at the working size, and reports how well the boxes
+agree (in source pixels) and how much faster the working-size path is.
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import ComicArchive  # noqa: E402
+from panels import WORK_DIM, detect_page_boxes, sort_panels  # noqa: E402
+
+
+def detect_boxes_4000(image):
+    """The original detector: colour resize to 4000 px, then threshold, boxes mapped to source pixels."""
+    height, width = image.shape[:2]
+    scale = 4000 / max(height, width)
+    image_resized = cv2.resize(image, (int(width * scale), int(height * scale)))
+    gray = cv2.cvtColor(image_resized, cv2.COLOR_BGR2GRAY)
+    _, thresh = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 1))
+    morphed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    inverted = cv2.bitwise_not(morphed)
+    contours, _ = cv2.findContours(inverted, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    panel_boxes = []
+    for cnt in contours:
+        x, y, w, h = cv2.boundingRect(cnt)
+        if w * h > 10000:
+            panel_boxes.append((x, y, w, h))
+    boxes = []
+    for x, y, w, h in sort_panels(panel_boxes, 30):
+        x0, y0 = int(x / scale), int(y / scale)
+        boxes.append((x0, y0, min(width, math.ceil((x + w) / scale)) - x0, min(height, math.ceil((y + h) / scale)) - y0))
+    return boxes
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+
+def compare_boxes(reference, candidate):
+    """Best-match IoU for each reference box, and whether reading order is identical."""
+    scores = [max((iou(box, other) for other in candidate), default=0.0) for box in reference]
+    same_order = len(reference) == len(candidate) and all(
+        iou(box, other) >= 0.9 for box, other in zip(reference, candidate))
+    return scores, same_order
+
+
+def timed(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("archives", nargs="+")
+    parser.add_argument("--pages", type=int, default=20, help="pages per archive (default 20)")
+    parser.add_argument("--work-dim", type=int, default=WORK_DIM)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    full_time = work_time = 0.0
+    pages = same_order_pages = 0
+    all_scores = []
+    for path in args.archives:
+        with ComicArchive(path) as archive:
+            for page_index in range(min(args.pages, len(archive))):
+                image = archive.decode(page_index)
+                if image is None:
+                    continue
+                reference, full_elapsed = timed(detect_boxes_4000, image, repeat=args.repeat)
+                candidate, work_elapsed = timed(detect_page_boxes, image, args.work_dim, repeat=args.repeat)
+                scores, same_order = compare_boxes(reference, candidate)
+                full_time += full_elapsed
+                work_time += work_elapsed
+                pages += 1
+                same_order_pages += same_order
+                all_scores.extend(scores)
+                print(f"{os.path.basename(path)} page {page_index + 1}: {len(reference)} vs {len(candidate)} boxes, "
+                      f"min IoU {min(scores, default=1.0):.3f}, {full_elapsed * 1000:.1f} ms -> {work_elapsed * 1000:.1f} ms")
+
+    if not pages:
+        print("No pages decoded.")
+        return 1
+    print()
+    print(f"pages:               {pages}")
+    print(f"same boxes & order:  {same_order_pages}/{pages}")
+    print(f"mean / min IoU:      {sum(all_scores) / max(1, len(all_scores)):.3f} / {min(all_scores, default=1.0):.3f}")
+    print(f"4000 px path:        {full_time / pages * 1000:.1f} ms/page")
+    print(f"{args.work_dim} px path:        {work_time / pages * 1000:.1f} ms/page")
+    print(f"speedup:             {full_time / work_time:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
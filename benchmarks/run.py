@@ -0,0 +1,316 @@
+"""Benchmark the viewer's hot paths on a synthetic book.
+
+Usage: python benchmarks/run.py [--output FILE.json] [--archive BOOK.cbz] [synthetic book options]
+
+Generates a synthetic CBZ (see synthetic.py for the options) unless one is
+given, then times:
+
+- cold start of `main.py BOOK` in a fresh process: time to the window
+  painted and to the first page, against STARTUP_TARGET_MS
+- open-to-first-pixel through ComicViewer.open_path, in panel and
+  fit-width mode, with a cold and a warm panel index
+- panel detection throughput per engine, page by page and in batches of
+  BATCH_SIZE as the viewer and indexer run it, against the per-page
+  contour loop and the original 4000 px detect_panels path
+- panel-step latency of show_next_panel
+- per-tick latency of fit-width wheelEvent
+- peak RSS of the viewer and of its worker processes
+
+The viewer runs offscreen (QT_QPA_PLATFORM=offscreen unless set), in a
+scratch directory with its own panel index cache, so runs do not touch the
+user's session, settings or cache. Results are written as JSON, tagged with
+the git commit, so runs can be compared across commits.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from archive import ComicArchive  # noqa: E402
+from panel_index import ENGINES  # noqa: E402
+from panels import (BATCH_SIZE, WORK_DIM, detect_page_boxes, detect_pages_boxes, detect_panels,  # noqa: E402
+                    to_source_boxes)
+from synthetic import add_arguments, archive_options, make_cbz  # noqa: E402
+
+WINDOW_SIZE = (1280, 900)
+# Cold start budget, process launch to window painted and to first page shown
+STARTUP_TARGET_MS = {"window_ms": 500, "first_page_ms": 1000}
+
+
+def summarize(samples):
+    """Median, p95 and max of a list of seconds, in milliseconds."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def contour_per_page(image):
+    """The contour engine one page at a time, as detect_page_boxes ran it before batching."""
+    working, boxes = detect_panels(image, WORK_DIM)
+    return to_source_boxes(boxes, working.shape, image.shape)
+
+
+def in_batches(images, engine):
+    boxes = []
+    for start in range(0, len(images), BATCH_SIZE):
+        boxes += detect_pages_boxes(images[start:start + BATCH_SIZE], engine=engine)
+    return boxes
+
+
+def bench_detection(path, page_count):
+    """Decode and detection time per page, for each engine, per page and batched, and the 4000 px detect_panels path."""
+    with ComicArchive(path) as archive:
+        images = []
+        start = time.perf_counter()
+        for page_index in range(min(page_count, len(archive))):
+            images.append(archive.decode(page_index))
+        decode_time = time.perf_counter() - start
+
+    results = {"pages": len(images), "decode_ms_per_page": round(decode_time / len(images) * 1000, 3)}
+    runs = [("detect_panels_4000", lambda images: [detect_panels(image) for image in images]),
+            ("contour_per_page", lambda images: [contour_per_page(image) for image in images])]
+    for engine in ENGINES:
+        runs.append((engine, lambda images, engine=engine: [detect_page_boxes(image, engine=engine) for image in images]))
+        runs.append((f"{engine}_batch", lambda images, engine=engine: in_batches(images, engine)))
+    boxes = {}
+    for name, detect in runs:
+        start = time.perf_counter()
+        boxes[name] = detect(images)
+        elapsed = time.perf_counter() - start
+        results[name] = {"ms_per_page": round(elapsed / len(images) * 1000, 3),
+                         "pages_per_s": round(len(images) / elapsed, 2)}
+    # Batching must not change what is found
+    results["contour_batch_same_boxes"] = sum(batch == single for batch, single in
+                                              zip(boxes["contour_batch"], boxes["contour_per_page"]))
+    return results
+
+
+def wait_until(app, condition, timeout=60.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("Timed out waiting for the viewer")
+        app.processEvents()
+        time.sleep(0.0005)
+
+
+# Run with python -c in a fresh process, so nothing this script imports is loaded
+# yet: launch the viewer on argv[2] and print when it got where, as wall-clock times
+STARTUP_CHILD = """
+import json, sys, time
+stamps = {"started": time.time()}
+sys.path.insert(0, sys.argv[1])
+import main
+stamps["imported"] = time.time()
+app, viewer = main.launch([sys.argv[2]])
+stamps["window"] = time.time()
+while viewer.label.pixmap() is None or viewer.label.pixmap().isNull():
+    app.processEvents()
+    time.sleep(0.0005)
+stamps["first_page"] = time.time()
+if viewer.detector.executor is not None:
+    viewer.detector.executor.shutdown(wait=True)
+viewer.close()
+print(json.dumps(stamps))
+"""
+
+
+def bench_startup(path, runs, cwd):
+    """Launch the viewer on path in runs fresh processes and time each stage of the cold start."""
+    samples = {}
+    for _ in range(runs):
+        launched = time.time()
+        output = subprocess.run([sys.executable, "-c", STARTUP_CHILD, ROOT, path], cwd=cwd,
+                                capture_output=True, text=True, check=True).stdout
+        stamps = json.loads(output.strip().splitlines()[-1])
+        for name in ("started", "imported", "window", "first_page"):
+            samples.setdefault(name, []).append(stamps[name] - launched)
+    results = {f"{name}_ms": summarize(times) for name, times in samples.items()}
+    results["target"] = {name: {"target_ms": target, "met": results[name]["median_ms"] <= target}
+                         for name, target in STARTUP_TARGET_MS.items()}
+    return results
+
+
+def bench_viewer(path, panel_steps, wheel_ticks, tick_interval, memory_budget_mb=None):
+    from PyQt6.QtCore import QPoint, QPointF, Qt
+    from PyQt6.QtGui import QWheelEvent
+    from PyQt6.QtWidgets import QApplication
+
+    from main import ComicViewer
+
+    def wheel_down():
+        return QWheelEvent(QPointF(0, 0), QPointF(0, 0), QPoint(0, 0), QPoint(0, -120), Qt.MouseButton.NoButton,
+                           Qt.KeyboardModifier.NoModifier, Qt.ScrollPhase.ScrollUpdate, False)
+
+    def has_pixel():
+        pixmap = viewer.label.pixmap()
+        return pixmap is not None and not pixmap.isNull()
+
+    def open_to_first_pixel():
+        start = time.perf_counter()
+        viewer.open_path(path)
+        wait_until(app, has_pixel)
+        return time.perf_counter() - start
+
+    app = QApplication.instance() or QApplication([])
+    results = {}
+    start = time.perf_counter()
+    viewer = ComicViewer(memory_budget_mb)
+    viewer.resize(*WINDOW_SIZE)
+    viewer.show()
+    app.processEvents()
+    results["window_ready_ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+    # Panel mode: the first page is detected before anything can be shown
+    viewer.reading_menu_panel_action.trigger()
+    results["open_to_first_pixel_panel_cold_ms"] = round(open_to_first_pixel() * 1000, 3)
+    start = time.perf_counter()
+    wait_until(app, lambda: not viewer.panel_index.pending_count, timeout=600.0)
+    results["detect_book_after_open_s"] = round(time.perf_counter() - start, 3)
+    results["panels"] = viewer.panel_index.panel_count
+    results["open_to_first_pixel_panel_warm_ms"] = round(open_to_first_pixel() * 1000, 3)
+
+    # Step through the book with the panel and page caches emptied first
+    viewer.show_first_panel()
+    viewer.panel_pyramid.pixmaps.clear()
+    viewer.page_cache.images.clear()
+    steps = []
+    for _ in range(panel_steps):
+        position = (viewer.page_number, viewer.panel_number)
+        start = time.perf_counter()
+        viewer.show_next_panel()
+        steps.append(time.perf_counter() - start)
+        app.processEvents()
+        if (viewer.page_number, viewer.panel_number) == position:
+            break
+    results["show_next_panel"] = summarize(steps)
+
+    # Fit width: the page is decoded on open, scrolling relies on prefetch
+    viewer.reading_menu_fit_width_action.trigger()
+    results["open_to_first_pixel_fit_width_ms"] = round(open_to_first_pixel() * 1000, 3)
+    ticks = []
+    for _ in range(wheel_ticks):
+        start = time.perf_counter()
+        viewer.wheelEvent(wheel_down())
+        ticks.append(time.perf_counter() - start)
+        deadline = time.perf_counter() + tick_interval
+        while time.perf_counter() < deadline:
+            app.processEvents()
+            time.sleep(0.0005)
+    results["fit_width_wheel_tick"] = summarize(ticks)
+    results["fit_width_pages_scrolled"] = viewer.page_number - 1
+    results["memory_governor"] = viewer.memory.stats()
+
+    # The viewer does not wait for its workers on close; reap them first so their RSS is counted
+    if viewer.detector.executor is not None:
+        viewer.detector.executor.shutdown(wait=True)
+    viewer.close()
+    app.processEvents()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--archive", default=None, help="benchmark this book instead of a synthetic one")
+    parser.add_argument("--output", default=None, help="write the JSON results here (default: stdout)")
+    parser.add_argument("--detect-pages", type=int, default=12, help="pages timed per detection engine")
+    parser.add_argument("--panel-steps", type=int, default=60)
+    parser.add_argument("--wheel-ticks", type=int, default=200)
+    parser.add_argument("--tick-interval-ms", type=float, default=16.0, help="time between wheel ticks")
+    parser.add_argument("--memory-budget-mb", type=int, default=None, help="viewer memory budget")
+    parser.add_argument("--startup-runs", type=int, default=3, help="cold starts timed")
+    parser.add_argument("--keep-scratch", action="store_true", help="keep the scratch dir (book, cache, session)")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    output = os.path.abspath(args.output) if args.output else None
+
+    scratch = tempfile.mkdtemp(prefix="panel_viewer_bench_")
+    os.environ["XDG_CACHE_HOME"] = os.path.join(scratch, "cache")
+    if args.archive:
+        path = os.path.abspath(args.archive)
+        config = {"archive": os.path.basename(path)}
+    else:
+        path = os.path.join(scratch, "synthetic.cbz")
+        config = archive_options(args)
+        start = time.perf_counter()
+        make_cbz(path, **config)
+        print(f"Generated {config['pages']} pages in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    config["archive_bytes"] = os.path.getsize(path)
+
+    results = {"detection": bench_detection(path, args.detect_pages)}
+    # First, so the book's panel index is not cached yet
+    results["startup"] = bench_startup(path, args.startup_runs, scratch)
+    # The viewer prints as it goes and writes its session and settings to the cwd
+    cwd = os.getcwd()
+    os.chdir(scratch)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results["viewer"] = bench_viewer(path, args.panel_steps, args.wheel_ticks, args.tick_interval_ms / 1000,
+                                             args.memory_budget_mb)
+    finally:
+        os.chdir(cwd)
+        if args.keep_scratch:
+            print(f"Kept {scratch}", file=sys.stderr)
+        else:
+            shutil.rmtree(scratch, ignore_errors=True)
+    # ru_maxrss is in KiB on Linux; worker processes count once they have been reaped
+    results["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    results["peak_rss_children_mb"] = round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1)
+
+    from PyQt6.QtCore import PYQT_VERSION_STR, QT_VERSION_STR
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "qt": QT_VERSION_STR,
+        "pyqt": PYQT_VERSION_STR,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Wrote {output}", file=sys.stderr)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
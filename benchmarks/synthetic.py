@@ -0,0 +1,91 @@
+"""Generate synthetic comic archives for benchmarking.
+
+Usage: python benchmarks/synthetic.py OUT.cbz [--pages N] [--width W] [--height H]
+           [--rows R] [--cols C] [--gutter G] [--compression stored|deflated] [--format jpg|png]
+
+Each page is a white sheet with a rows x cols grid of bordered panels
+separated by white gutters. The panels hold random shapes, so encoded sizes
+and decode costs are in the range of real scans. The same seed always gives
+the same archive.
+"""
+import argparse
+import sys
+import zipfile
+
+import cv2
+import numpy as np
+
+COMPRESSION = {"stored": zipfile.ZIP_STORED, "deflated": zipfile.ZIP_DEFLATED}
+
+
+def grid_boxes(width, height, rows, cols, gutter):
+    """Panel boxes (x, y, w, h) of the page grid, in reading order."""
+    panel_width = (width - gutter * (cols + 1)) // cols
+    panel_height = (height - gutter * (rows + 1)) // rows
+    return [(gutter + col * (panel_width + gutter), gutter + row * (panel_height + gutter), panel_width, panel_height)
+            for row in range(rows) for col in range(cols)]
+
+
+def make_page(width, height, rows, cols, gutter, rng):
+    page = np.full((height, width, 3), 255, np.uint8)
+    for x, y, w, h in grid_boxes(width, height, rows, cols, gutter):
+        panel = page[y:y + h, x:x + w]
+        # Vertical colour gradient as the background
+        top, bottom = rng.integers(40, 220, 3), rng.integers(40, 220, 3)
+        ramp = np.linspace(0.0, 1.0, h)[:, None, None]
+        panel[:] = (top * (1 - ramp) + bottom * ramp).astype(np.uint8)
+        for _ in range(12):
+            color = tuple(int(c) for c in rng.integers(0, 256, 3))
+            center = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+            cv2.circle(panel, center, int(rng.integers(10, max(11, min(w, h) // 4))), color, -1)
+            end = (int(rng.integers(0, w)), int(rng.integers(0, h)))
+            cv2.line(panel, center, end, color, int(rng.integers(1, 6)))
+        cv2.rectangle(panel, (0, 0), (w - 1, h - 1), (0, 0, 0), 3)
+    return page
+
+
+def make_cbz(path, pages=24, width=1988, height=3056, rows=3, cols=2, gutter=40, compression="deflated",
+             image_format="jpg", quality=90, seed=0):
+    """Write a synthetic CBZ to path and return the panel boxes of one page."""
+    rng = np.random.default_rng(seed)
+    params = [cv2.IMWRITE_JPEG_QUALITY, quality] if image_format == "jpg" else []
+    with zipfile.ZipFile(path, "w", compression=COMPRESSION[compression]) as archive:
+        for page_index in range(pages):
+            page = make_page(width, height, rows, cols, gutter, rng)
+            ok, encoded = cv2.imencode(f".{image_format}", page, params)
+            if not ok:
+                raise RuntimeError(f"Failed to encode page {page_index}")
+            archive.writestr(f"pages/page{page_index + 1:04d}.{image_format}", encoded.tobytes())
+    return grid_boxes(width, height, rows, cols, gutter)
+
+
+def add_arguments(parser):
+    parser.add_argument("--pages", type=int, default=24)
+    parser.add_argument("--width", type=int, default=1988)
+    parser.add_argument("--height", type=int, default=3056)
+    parser.add_argument("--rows", type=int, default=3)
+    parser.add_argument("--cols", type=int, default=2)
+    parser.add_argument("--gutter", type=int, default=40)
+    parser.add_argument("--compression", choices=sorted(COMPRESSION), default="deflated")
+    parser.add_argument("--format", dest="image_format", choices=("jpg", "png"), default="jpg")
+    parser.add_argument("--quality", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def archive_options(args):
+    return {name: getattr(args, name) for name in
+            ("pages", "width", "height", "rows", "cols", "gutter", "compression", "image_format", "quality", "seed")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output")
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+    make_cbz(args.output, **archive_options(args))
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
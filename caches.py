@@ -0,0 +1,151 @@
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Least-recently-used mapping bounded by the total byte size of its values.
+
+    sizeof(value) gives the cost of each entry. hits, misses and evictions
+    count lookups since creation. With a governor the cache also counts
+    towards the governor's budget and may have entries evicted by it. Not
+    thread-safe; use it from one thread.
+    """
+
+    def __init__(self, max_bytes, sizeof, governor=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> [value, size, last use on the governor's clock]
+        self._items = OrderedDict()
+        self.governor = governor
+        if governor is not None:
+            governor.register(self)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        entry = self._items.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        if self.governor is not None:
+            entry[2] = self.governor.tick()
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value):
+        self.discard(key)
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            return  # Would evict everything else and still not fit
+        self._items[key] = [value, size, self.governor.tick() if self.governor is not None else 0]
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            self.evict(next(iter(self._items)))
+        if self.governor is not None:
+            self.governor.enforce(self, key)
+
+    def evict(self, key):
+        self.discard(key)
+        self.evictions += 1
+
+    def discard(self, key):
+        entry = self._items.pop(key, None)
+        if entry is not None:
+            self.current_bytes -= entry[1]
+
+    def discard_where(self, predicate):
+        """Drop every entry whose key predicate(key) is true."""
+        for key in [key for key in self._items if predicate(key)]:
+            self.discard(key)
+
+    def clear(self):
+        self._items.clear()
+        self.current_bytes = 0
+
+    def entries(self):
+        """(key, size, last use) of every entry, least recently used first."""
+        return [(key, size, used) for key, (_, size, used) in self._items.items()]
+
+    def stats(self):
+        return {
+            "entries": len(self._items),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class MemoryGovernor:
+    """One byte budget shared by every LRUCache registered with it.
+
+    When a put takes the caches over max_bytes together, entries are evicted
+    across all of them in least-recently-used order, except that entries for
+    pages more than one page behind the reader go first. Cache keys whose
+    first item is a page number take part in that; other keys are plain LRU.
+    set_position() tells the governor where the reader is and which way
+    they are going. Not thread-safe; use it from the caches' thread.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.caches = []
+        self.clock = 0
+        self.page = None
+        self.direction = 1
+        self.evictions = 0
+
+    def register(self, cache):
+        self.caches.append(cache)
+
+    def tick(self):
+        self.clock += 1
+        return self.clock
+
+    def set_position(self, page, direction=1):
+        self.page = page
+        self.direction = direction or 1
+
+    @property
+    def current_bytes(self):
+        return sum(cache.current_bytes for cache in self.caches)
+
+    def _behind(self, key):
+        if self.page is None or not isinstance(key, tuple) or not key or not isinstance(key[0], int):
+            return False
+        return (key[0] - self.page) * self.direction < -1
+
+    def enforce(self, keep_cache=None, keep_key=None):
+        """Evict until the caches fit the budget, never the entry keep_key of keep_cache."""
+        excess = self.current_bytes - self.max_bytes
+        if excess <= 0:
+            return
+        # Last-use stamps are unique, so ordering never falls through to the caches
+        candidates = sorted(
+            ((not self._behind(key), used), cache, key, size)
+            for cache in self.caches
+            for key, size, used in cache.entries()
+            if not (cache is keep_cache and key == keep_key)
+        )
+        for _, cache, key, size in candidates:
+            if excess <= 0:
+                break
+            cache.evict(key)
+            self.evictions += 1
+            excess -= size
+
+    def stats(self):
+        return {
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,38 @@
+from PyQt6 import sip
+from PyQt6.QtGui import QImage, QPixmap
+
+from instrument import recorder
+
+
+def to_qimage(image):
+    """Wrap a BGR or grayscale uint8 array as a QImage without copying the pixels.
+
+    Row-strided views such as page crops are wrapped in place; anything
+    else is made contiguous first. The QImage does not own the memory, so
+    the array is kept alive on it as _array. Derived images (scaled(),
+    copy(), QPixmap.fromImage()) own their pixels and do not need it.
+    """
+    if image.ndim == 2:
+        image_format, channels = QImage.Format.Format_Grayscale8, 1
+    else:
+        image_format, channels = QImage.Format.Format_BGR888, 3
+    if image.ndim == 3 and image.shape[2] != 3:
+        raise ValueError(f"Unsupported image shape {image.shape}")
+    if image.dtype != "uint8" or image.strides[-1] != 1 or (image.ndim == 3 and image.strides[1] != channels):
+        image = image.astype("uint8", order="C")
+    height, width = image.shape[:2]
+    q_image = QImage(sip.voidptr(image.ctypes.data), width, height, image.strides[0], image_format)
+    q_image._array = image
+    return q_image
+
+
+def to_qpixmap(image):
+    return pixmap_from_image(to_qimage(image))
+
+
+def pixmap_from_image(q_image):
+    """QPixmap.fromImage, recorded as the convert stage. GUI thread only."""
+    with recorder.span("convert"):
+        pixmap = QPixmap.fromImage(q_image)
+    recorder.count("pixmap_bytes", q_image.sizeInBytes())
+    return pixmap
@@ -0,0 +1,116 @@
+"""Headless panel indexer.
+
+Usage: python main.py index DIR [--jobs N] [--engine contour|xycut] [--cache-dir PATH]
+
+Walks DIR for CBZ/ZIP files and detects the panels of every book on a
+process pool, writing the same panel indexes the viewer loads when it
+opens a book. Progress is saved as it goes, so an interrupted run picks
+up where it stopped: finished books are skipped and partly indexed books
+only detect their missing pages.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from archive import ComicArchive
+from panel_cache import PanelIndexCache
+from panel_index import DEFAULT_ENGINE, ENGINES
+from panels import process_book
+
+ARCHIVE_EXTENSIONS = ('.cbz', '.zip')
+# Save a partly indexed book after this many newly detected pages
+SAVE_EVERY = 64
+
+
+def find_archives(root):
+    archives = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(ARCHIVE_EXTENSIONS):
+                archives.append(os.path.join(dirpath, filename))
+    return archives
+
+
+def index_book(path, engine=DEFAULT_ENGINE, cache_dir=None, max_cache_bytes=None):
+    """Detect the pages of one book missing from its panel index.
+
+    Returns (path, pages in book, pages detected now, error message or None).
+    """
+    cache = PanelIndexCache(cache_dir) if max_cache_bytes is None else PanelIndexCache(cache_dir, max_cache_bytes)
+    try:
+        with ComicArchive(path) as archive:
+            pages = cache.load(archive, engine)
+            todo = [page_index for page_index in range(len(archive)) if page_index not in pages]
+            unsaved = 0
+            try:
+                for results in process_book(archive, todo, engine):
+                    for page_index, size, boxes in results:
+                        # Pages that cannot be decoded are recorded too, so resuming skips them
+                        pages[page_index] = (size or (0, 0), boxes)
+                    unsaved += len(results)
+                    if unsaved >= SAVE_EVERY:
+                        cache.store(archive, pages, engine)
+                        unsaved = 0
+            finally:
+                # Keep what was detected even if the book fails part way
+                if unsaved:
+                    cache.store(archive, pages, engine)
+            return path, len(archive), len(todo), None
+    except Exception as e:
+        return path, 0, 0, str(e)
+
+
+def run_index(root, jobs=None, engine=DEFAULT_ENGINE, cache_dir=None, max_cache_bytes=None, out=sys.stdout):
+    archives = find_archives(root)
+    if not archives:
+        print(f"No CBZ/ZIP files found under {root}", file=out)
+        return 1
+
+    start = time.perf_counter()
+    detected_pages = 0
+    failures = 0
+    executor = ProcessPoolExecutor(max_workers=jobs or os.cpu_count())
+    try:
+        futures = [executor.submit(index_book, path, engine, cache_dir, max_cache_bytes) for path in archives]
+        for done, future in enumerate(as_completed(futures), 1):
+            path, page_count, new_pages, error = future.result()
+            detected_pages += new_pages
+            elapsed = time.perf_counter() - start
+            rate = detected_pages / elapsed if elapsed else 0.0
+            if error:
+                failures += 1
+                status = f"failed: {error}"
+            elif new_pages:
+                status = f"{new_pages}/{page_count} pages detected"
+            else:
+                status = "already indexed"
+            print(f"[{done}/{len(archives)}] {os.path.relpath(path, root)}: {status} ({rate:.1f} pages/s)", file=out)
+    except KeyboardInterrupt:
+        print("Interrupted, run again to resume.", file=out)
+        executor.shutdown(wait=False, cancel_futures=True)
+        return 130
+    executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    print(f"Indexed {len(archives) - failures} books, {detected_pages} pages detected in {elapsed:.1f} s "
+          f"({detected_pages / elapsed if elapsed else 0.0:.1f} pages/s)", file=out)
+    return 1 if failures else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="main.py index", description="Pre-compute panel indexes for a library.")
+    parser.add_argument("directory")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--engine", choices=ENGINES, default=DEFAULT_ENGINE)
+    parser.add_argument("--cache-dir", default=None, help="panel index directory (default: the viewer's)")
+    parser.add_argument("--max-cache-mb", type=int, default=None, help="size cap of the panel index directory")
+    args = parser.parse_args(argv)
+    max_cache_bytes = args.max_cache_mb * 1024 * 1024 if args.max_cache_mb else None
+    return run_index(args.directory, args.jobs, args.engine, args.cache_dir, max_cache_bytes)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""Timing spans and counters for the rendering pipeline.
+
+Stages are wrapped in named spans and byte/event counts go to counters:
+
+    with recorder.span("decode"):
+        image = cv2.imdecode(data, flags)
+    recorder.count("decoded_bytes", image.nbytes)
+
+Recording is off by default. While it is off span() returns a shared no-op
+context manager and count() returns at once, so instrumented code costs one
+attribute check per call. Spans are recorded per process and thread;
+detection workers run in their own processes and are not recorded there.
+Recorded spans can be exported as Chrome trace JSON (chrome://tracing,
+ui.perfetto.dev) or summarised over a rolling window for the stats overlay.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("recorder", "name", "start")
+
+    def __init__(self, recorder, name):
+        self.recorder = recorder
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.add(self.name, self.start, time.perf_counter_ns())
+        return False
+
+
+class Recorder:
+    """Bounded in-memory log of spans and counters, safe to use from any thread."""
+
+    def __init__(self, max_events=200000):
+        self.enabled = False
+        self.origin = time.perf_counter_ns()
+        # (name, thread id, start ns, duration ns); appends are atomic
+        self.events = deque(maxlen=max_events)
+        self.counters = {}
+        # (name, time ns, running total) for the trace's counter tracks
+        self.counter_samples = deque(maxlen=max_events)
+        self.lock = threading.Lock()
+
+    def span(self, name):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def add(self, name, start, end, thread=None):
+        """Record a span measured elsewhere, start and end in perf_counter_ns() time."""
+        if self.enabled:
+            self.events.append((name, thread if thread is not None else threading.get_ident(), start, end - start))
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            total = self.counters.get(name, 0) + value
+            self.counters[name] = total
+        self.counter_samples.append((name, time.perf_counter_ns(), total))
+
+    def reset(self):
+        with self.lock:
+            self.events.clear()
+            self.counters.clear()
+            self.counter_samples.clear()
+            self.origin = time.perf_counter_ns()
+
+    def stats(self, window=2.0):
+        """Per-span {name: (count, total ms, max ms)} over the last window seconds."""
+        since = time.perf_counter_ns() - int(window * 1e9)
+        stats = {}
+        for name, _, start, duration in reversed(list(self.events)):
+            if start < since:
+                break
+            count, total, longest = stats.get(name, (0, 0.0, 0.0))
+            ms = duration / 1e6
+            stats[name] = (count + 1, total + ms, max(longest, ms))
+        return stats
+
+    def chrome_trace(self, extra_counters=None):
+        """The recorded spans and counters as a Chrome trace event dict.
+
+        extra_counters is {name: {key: number}} sampled once at export time,
+        such as cache statistics kept outside the recorder.
+        """
+        pid = os.getpid()
+        origin = self.origin
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "panel_viewer"}}]
+        for name, thread, start, duration in list(self.events):
+            events.append({"name": name, "cat": "pipeline", "ph": "X", "pid": pid, "tid": thread,
+                           "ts": (start - origin) / 1000, "dur": duration / 1000})
+        for name, at, total in list(self.counter_samples):
+            events.append({"name": name, "ph": "C", "pid": pid, "ts": (at - origin) / 1000, "args": {name: total}})
+        now = (time.perf_counter_ns() - origin) / 1000
+        for name, values in (extra_counters or {}).items():
+            events.append({"name": name, "ph": "C", "pid": pid, "ts": now, "args": values})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path, extra_counters=None):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(extra_counters), f)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, or None where it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+# The process-wide recorder used by the pipeline modules
+recorder = Recorder()
@@ -1,40 +1,720 @@
+import argparse
 import sys
 import os
-import zipfile
-import cv2
-import numpy as np
-import pygame
-from PyQt6.QtGui import (QGuiApplication, QAction,QWheelEvent)
+from PyQt6.QtGui import (QGuiApplication, QAction, QPainter)
 from PyQt6.QtWidgets import (
-    QApplication, QMainWindow,QFileDialog,QLabel,QHBoxLayout,QVBoxLayout,    QWidget, QPushButton )
-from PyQt6.QtGui import QImage, QPixmap
-from PyQt6.QtCore import Qt,QPointF, QPoint
-import shutil
+    QApplication, QMainWindow,QFileDialog,QLabel,QHBoxLayout,QVBoxLayout,    QWidget, QPushButton, QSizePolicy,
+    QListView )
+from PyQt6.QtGui import QPixmap
+from PyQt6.QtCore import Qt, QObject, QTimer, pyqtSignal, QAbstractListModel, QModelIndex, QSize
 import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from panel_index import DEFAULT_ENGINE, ENGINES, PanelIndex
+from panel_cache import PanelIndexCache, default_cache_dir
+from caches import LRUCache, MemoryGovernor
+from imaging import pixmap_from_image, to_qimage, to_qpixmap
+from instrument import peak_rss_bytes, recorder
+from thumbnails import THUMBNAIL_HEIGHT, ThumbnailCache, lower_priority, thumbnail_pages
+# archive and panels load OpenCV and NumPy, which take longer to import than
+# the window takes to build; they are imported where first used instead
+
+# Spans shown in the stats overlay, in pipeline order, and the window they are averaged over
+PIPELINE_STAGES = ("read", "decode", "detect", "sort", "detect_batch", "crop", "convert", "scale", "paint")
+STATS_WINDOW = 2.0
+MB = 1024 * 1024
+# Memory all image caches of the viewer may use together, unless set in settings or on the command line
+DEFAULT_MEMORY_BUDGET_MB = 512
+# Fit-width pages are scaled and cached in horizontal tiles this many display pixels tall
+TILE_HEIGHT = 512
+# Pages on each side of the current one that are detected before the rest of the book
+DETECT_AROUND = 3
+
+
+def pixmap_nbytes(pixmap):
+    return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+
+def scale_tile(image, width, page_height, index):
+    """Scale the rows of a page under fit-width tile index to a QImage. Safe to call off the GUI thread.
+
+    The page is shown width pixels wide and page_height tall; image may be a
+    reduced decode, rows are picked in proportion.
+    """
+    top = index * TILE_HEIGHT
+    bottom = min(top + TILE_HEIGHT, page_height)
+    rows = image.shape[0]
+    y0 = top * rows // page_height
+    y1 = max(y0 + 1, -(-bottom * rows // page_height))
+    with recorder.span("scale"):
+        return to_qimage(image[y0:y1]).scaled(width, bottom - top, Qt.AspectRatioMode.IgnoreAspectRatio,
+                                              Qt.TransformationMode.SmoothTransformation)
+
+
+def fit_image(image, size):
+    """Scale a BGR page to a QImage that fits in size, keeping its aspect ratio. Safe to call off the GUI thread."""
+    with recorder.span("scale"):
+        return to_qimage(image).scaled(size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+
+
+def scale_to_fit(image, size):
+    """Scale a BGR page to a pixmap that fits in size, keeping its aspect ratio."""
+    return pixmap_from_image(fit_image(image, size))
+
+
+def detection_order(current, page_count, around=DETECT_AROUND):
+    """Page indexes in the order to detect them: current, its neighbours nearest first, then the rest."""
+    if not 0 <= current < page_count:
+        return list(range(page_count))
+    order = [current]
+    for distance in range(1, around + 1):
+        order += [page_index for page_index in (current - distance, current + distance)
+                  if 0 <= page_index < page_count]
+    near = set(order)
+    rest = [page_index for page_index in range(current + 1, page_count) if page_index not in near]
+    rest += [page_index for page_index in range(current - 1, -1, -1) if page_index not in near]
+    return order + rest
+
+
+def load_archive(zip_path):
+    """Open a book, importing the imaging stack if this is the first. Safe to call off the GUI thread."""
+    from archive import ComicArchive
+    return ComicArchive(zip_path)
+
+
+def warm_up_imaging():
+    """Import the imaging stack before the first book is opened."""
+    import panels  # noqa: F401
+
+
+class PageLabel(QLabel):
+    """The label pages and panels are shown in, with painting recorded as the paint stage."""
+    resized = pyqtSignal(QSize)  # size before the resize
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.resized.emit(event.oldSize())
+
+    def paintEvent(self, event):
+        with recorder.span("paint"):
+            super().paintEvent(event)
+
+
+class PageCache(QObject):
+    """Decoded pages and their fit-width tiles, with background read-ahead.
+
+    Pages are decoded at the smallest DCT reduction (1/2, 1/4, 1/8) that
+    still covers the size they are shown at, so full resolution is only
+    decoded when a view needs those pixels. Decoded pages are keyed by
+    (page, reduction).
+
+    In fit-width mode the book is one continuous strip of pages, each shown
+    width pixels wide. Pages are scaled in TILE_HEIGHT tiles keyed by
+    (page, width, tile index), and only the tiles around the viewport are
+    made, so a very tall page never becomes one huge pixmap.
+
+    Whole pages fitted into the view are keyed by (page, width, height).
+
+    Lookups run on the GUI thread and decode synchronously on a miss.
+    prefetch() decodes, and in page view fits, the pages around the current
+    one and prefetch_strip() scales the tiles around the viewport on a small
+    thread pool (imdecode and QImage scaling release the GIL); the results
+    are handed back to the GUI thread through the loaded signal.
+    """
+    loaded = pyqtSignal(int, int, int, object, object, object, object, object)  # generation, page, reduction, image, width, tile indexes, tiles, fitted page
+
+    def __init__(self, parent=None, max_bytes=384 * 1024 * 1024, prefetch_count=3, governor=None):
+        super().__init__(parent)
+        self.archive = None
+        self.generation = 0
+        self.prefetch_count = prefetch_count
+        # Two thirds for decoded pages, the rest for scaled tiles and fitted pages
+        self.images = LRUCache(max_bytes * 2 // 3, lambda image: image.nbytes, governor)
+        self.tiles = LRUCache(max_bytes // 3, pixmap_nbytes, governor)
+        self.page_pixmaps = LRUCache(max_bytes // 6, pixmap_nbytes, governor)
+        # (page, reduction) of pages, (page, width, index) of tiles and (page, (width, height)) of fitted pages being loaded
+        self.in_flight = set()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.loaded.connect(self._on_loaded)
+
+    def reset(self, archive):
+        self.generation += 1
+        self.archive = archive
+        self.images.clear()
+        self.tiles.clear()
+        self.page_pixmaps.clear()
+        self.in_flight.clear()
+
+    def page_size(self, page_number):
+        return self.archive.page_size(page_number - 1)
+
+    def fit_scale(self, page_number, width, height=None):
+        """Display scale of a page shown at width, or fitted into width x height."""
+        page_height, page_width = self.page_size(page_number)
+        if not page_width or not page_height:
+            return 1.0
+        scale = width / page_width
+        if height is not None:
+            scale = min(scale, height / page_height)
+        return scale
+
+    def image(self, page_number, scale=1.0):
+        """Page decoded at the smallest reduction that still covers scale times its size.
+
+        The result may be larger than asked for if a finer decode is already
+        cached; callers work from its actual shape.
+        """
+        if self.archive is None or not 1 <= page_number <= len(self.archive):
+            return None
+        from archive import reduction_for_scale
+        reduction = reduction_for_scale(scale)
+        image = self.cached_image(page_number, reduction)
+        if image is not None:
+            return image
+        image = self.archive.decode_reduced(page_number - 1, reduction)
+        if image is not None:
+            self.images.put((page_number, reduction), image)
+        return image
+
+    def cached_image(self, page_number, reduction):
+        """Page decoded at reduction, or finer, if one is cached."""
+        image = self.images.get((page_number, reduction))
+        if image is not None:
+            return image
+        for finer in (4, 2, 1):
+            if finer < reduction and (page_number, finer) in self.images:
+                return self.images.get((page_number, finer))
+        return None
+
+    def page_height(self, page_number, width):
+        """Height of a page shown width pixels wide, 0 if its size is unknown."""
+        page_height, page_width = self.page_size(page_number)
+        if not page_width or not page_height:
+            return 0
+        return max(1, round(page_height * width / page_width))
+
+    def strip_position(self, page_number, offset, width):
+        """Move offset rows into page_number onto the page those rows fall on.
+
+        Returns (page, offset within it). Offsets before the first page are
+        clamped to its top; past the last page the offset is left beyond its end.
+        """
+        while offset < 0 and page_number > 1:
+            page_number -= 1
+            offset += self.page_height(page_number, width)
+        while page_number < len(self.archive) and offset >= self.page_height(page_number, width):
+            offset -= self.page_height(page_number, width)
+            page_number += 1
+        return page_number, max(0, offset)
+
+    def strip_tiles(self, page_number, offset, width, height):
+        """(page, tile index, y) of the tiles covering height rows of the strip from offset rows into page_number.
+
+        y is the tile's top relative to the first of those rows; the strip
+        runs on across page ends.
+        """
+        tiles = []
+        y = -offset
+        while y < height and page_number <= len(self.archive):
+            page_height = self.page_height(page_number, width)
+            for index in range(max(0, -y) // TILE_HEIGHT, -(-page_height // TILE_HEIGHT)):
+                if y + index * TILE_HEIGHT >= height:
+                    break
+                tiles.append((page_number, index, y + index * TILE_HEIGHT))
+            y += page_height
+            page_number += 1
+        return tiles
+
+    def tile(self, page_number, width, index):
+        key = (page_number, width, index)
+        pixmap = self.tiles.get(key)
+        if pixmap is None:
+            image = self.image(page_number, self.fit_scale(page_number, width))
+            if image is None:
+                return None
+            pixmap = pixmap_from_image(scale_tile(image, width, self.page_height(page_number, width), index))
+            self.tiles.put(key, pixmap)
+        return pixmap
+
+    def fit_page(self, page_number, size):
+        """Pixmap of the whole page fitted into size."""
+        if self.archive is None or not 1 <= page_number <= len(self.archive):
+            return None
+        key = (page_number, size.width(), size.height())
+        pixmap = self.page_pixmaps.get(key)
+        if pixmap is None:
+            image = self.image(page_number, self.fit_scale(page_number, size.width(), size.height()))
+            if image is None:
+                return None
+            pixmap = scale_to_fit(image, size)
+            self.page_pixmaps.put(key, pixmap)
+        return pixmap
+
+    def prefetch(self, page_number, direction, width=None, size=None):
+        """Decode the next pages in the reading direction and the one behind, in the background.
+
+        Pages are decoded at the reduction a fit-width view of width, or a
+        fit-page view of size, will ask for. For a fit-page view they are
+        also fitted into size, ready for fit_page().
+        """
+        if self.archive is None:
+            return
+        from archive import reduction_for_scale
+        pages = [page_number + direction * step for step in range(1, self.prefetch_count + 1)]
+        pages.append(page_number - direction)
+        for page in pages:
+            if not 1 <= page <= len(self.archive):
+                continue
+            fit_size = None
+            if width:
+                reduction = reduction_for_scale(self.fit_scale(page, width))
+            else:
+                reduction = reduction_for_scale(self.fit_scale(page, size.width(), size.height()))
+                fit_size = (size.width(), size.height())
+                if (page, *fit_size) in self.page_pixmaps or (page, fit_size) in self.in_flight:
+                    continue
+            key = (page, reduction)
+            image = self.images.get(key) if key in self.images else None
+            if image is None:
+                if key in self.in_flight:
+                    continue
+                self.in_flight.add(key)
+            elif fit_size is None:
+                continue
+            if fit_size is not None:
+                self.in_flight.add((page, fit_size))
+            self.executor.submit(self._load, self.generation, self.archive, page, reduction, image, width, 0, [],
+                                 fit_size)
+
+    def prefetch_strip(self, page_number, offset, width, height, direction):
+        """Scale the missing tiles within a viewport's height of the one at offset rows into page_number."""
+        if self.archive is None:
+            return
+        from archive import reduction_for_scale
+        first_page, first_offset = self.strip_position(page_number, offset - height, width)
+        missing = {}
+        for page, index, _ in self.strip_tiles(first_page, first_offset, width, 3 * height):
+            key = (page, width, index)
+            if key not in self.tiles and key not in self.in_flight:
+                self.in_flight.add(key)
+                missing.setdefault(page, []).append(index)
+        for page, indexes in missing.items():
+            reduction = reduction_for_scale(self.fit_scale(page, width))
+            image = self.images.get((page, reduction)) if (page, reduction) in self.images else None
+            if image is None:
+                if (page, reduction) in self.in_flight:
+                    # Already being decoded, ask for these tiles again once it is cached
+                    self.in_flight.difference_update((page, width, index) for index in indexes)
+                    continue
+                self.in_flight.add((page, reduction))
+            self.executor.submit(self._load, self.generation, self.archive, page, reduction, image, width,
+                                 self.page_height(page, width), indexes)
+        self.prefetch(page_number, direction, width)
+
+    def _load(self, generation, archive, page_number, reduction, image, width, page_height, tile_indexes,
+              fit_size=None):
+        # Runs on a pool thread
+        tiles = []
+        fitted = None if fit_size is None else (fit_size, None)
+        try:
+            if image is None:
+                image = archive.decode_reduced(page_number - 1, reduction)
+            if image is not None:
+                tiles = [(index, scale_tile(image, width, page_height, index)) for index in tile_indexes]
+                if fit_size is not None:
+                    fitted = (fit_size, fit_image(image, QSize(*fit_size)))
+        except Exception as e:
+            print(f"Prefetch of page {page_number} failed: {e}")
+            image = None
+        self.loaded.emit(generation, page_number, reduction, image, width, tile_indexes, tiles, fitted)
+
+    def _on_loaded(self, generation, page_number, reduction, image, width, tile_indexes, tiles, fitted):
+        if generation != self.generation:
+            return
+        self.in_flight.discard((page_number, reduction))
+        for index in tile_indexes:
+            self.in_flight.discard((page_number, width, index))
+        if image is not None and (page_number, reduction) not in self.images:
+            self.images.put((page_number, reduction), image)
+        for index, scaled in tiles:
+            self.tiles.put((page_number, width, index), pixmap_from_image(scaled))
+        if fitted is not None:
+            fit_size, scaled = fitted
+            self.in_flight.discard((page_number, fit_size))
+            if scaled is not None:
+                self.page_pixmaps.put((page_number, *fit_size), pixmap_from_image(scaled))
+
+    def discard_other_sizes(self, size):
+        """Drop tiles and fitted pages made for any view size but size."""
+        self.tiles.discard_where(lambda key: key[1] != size.width())
+        self.page_pixmaps.discard_where(lambda key: key[1:] != (size.width(), size.height()))
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PanelPyramid(QObject):
+    """Panel crops at each zoom step, rendered from the page's own pixels.
+
+    A level is a panel fitted into the view, never enlarged beyond its
+    source size, then multiplied by a zoom in 0.1 steps; levels are keyed
+    by (page, panel, view width, view height, zoom step). Each level is
+    cropped from the page decoded at the reduction its scale needs, so
+    zooming in shows finer pixels instead of magnifying the fitted crop.
+    level() renders on the GUI thread on a miss, prefetch() renders levels
+    ahead on the page cache's thread pool and hands them back through the
+    rendered signal.
+    """
+    rendered = pyqtSignal(int, object, int, object, object)  # generation, key, reduction, page image, panel image
+
+    def __init__(self, page_cache, parent=None, max_bytes=64 * 1024 * 1024, governor=None):
+        super().__init__(parent)
+        self.page_cache = page_cache
+        self.pixmaps = LRUCache(max_bytes, pixmap_nbytes, governor)
+        self.generation = 0
+        self.in_flight = set()
+        self.rendered.connect(self._on_rendered)
+
+    def reset(self):
+        self.generation += 1
+        self.pixmaps.clear()
+        self.in_flight.clear()
+
+    @staticmethod
+    def plan(record, view_size, zoom):
+        """Cache key and scale, relative to source pixels, of record at zoom in a view of view_size."""
+        zoom_step = round(zoom * 10)
+        fit = min(view_size.width() / record.w, view_size.height() / record.h, 1.0)
+        key = (record.page, record.panel, view_size.width(), view_size.height(), zoom_step)
+        return key, fit * zoom_step / 10
+
+    def level(self, record, view_size, zoom):
+        key, scale = self.plan(record, view_size, zoom)
+        pixmap = self.pixmaps.get(key)
+        if pixmap is None:
+            image = self.page_cache.image(record.page, scale)
+            if image is None:
+                return None
+            from panels import crop_panel
+            pixmap = to_qpixmap(crop_panel(image, record, scale, self.page_cache.page_size(record.page)))
+            self.pixmaps.put(key, pixmap)
+        return pixmap
+
+    def prefetch(self, levels):
+        """Render the missing (record, view size, zoom) levels in the background."""
+        from archive import reduction_for_scale
+        page_cache = self.page_cache
+        for record, view_size, zoom in levels:
+            key, scale = self.plan(record, view_size, zoom)
+            if key in self.pixmaps or key in self.in_flight:
+                continue
+            self.in_flight.add(key)
+            reduction = reduction_for_scale(scale)
+            page_cache.executor.submit(self._render, self.generation, page_cache.archive, key, record, scale, reduction,
+                                       page_cache.cached_image(record.page, reduction),
+                                       page_cache.page_size(record.page))
+
+    def _render(self, generation, archive, key, record, scale, reduction, image, page_size):
+        # Runs on a pool thread
+        from panels import crop_panel
+        decoded = None
+        panel = None
+        try:
+            if image is None:
+                image = decoded = archive.decode_reduced(record.page - 1, reduction)
+            if image is not None:
+                panel = to_qimage(crop_panel(image, record, scale, page_size))
+        except Exception as e:
+            print(f"Rendering panel {record.panel} of page {record.page} failed: {e}")
+        self.rendered.emit(generation, key, reduction, decoded, panel)
+
+    def _on_rendered(self, generation, key, reduction, decoded, panel):
+        if generation != self.generation:
+            return
+        self.in_flight.discard(key)
+        page = key[0]
+        if decoded is not None and (page, reduction) not in self.page_cache.images:
+            self.page_cache.images.put((page, reduction), decoded)
+        if panel is not None:
+            self.pixmaps.put(key, pixmap_from_image(panel))
+
+    def discard_other_sizes(self, view_size):
+        """Drop levels rendered for any view size but view_size."""
+        self.pixmaps.discard_where(lambda key: key[2:4] != (view_size.width(), view_size.height()))
+
+
+class ThumbnailLoader(QObject):
+    """Page thumbnails for the overview grid, made on a low-priority worker process.
+
+    The grid asks for the thumbnails of the pages it shows and those are
+    made first, most recently asked first. Otherwise the worker works
+    through the rest of the book, so the on-disk ThumbnailCache fills in
+    the background. Batches go to a single worker process at reduced OS
+    priority, one at a time, so thumbnails do not compete with rendering
+    the current page. Only thumbnails the grid asked for are kept in memory.
+    """
+    ready = pyqtSignal(int)  # page
+    batch_done = pyqtSignal(int, object)  # generation, thumbnail_pages() result
+
+    def __init__(self, parent=None, max_bytes=64 * 1024 * 1024, governor=None, batch_size=16):
+        super().__init__(parent)
+        self.cache = ThumbnailCache()
+        self.pixmaps = LRUCache(max_bytes, pixmap_nbytes, governor)
+        self.batch_size = batch_size
+        self.archive = None
+        self.book_dir = None
+        self.generation = 0
+        self.executor = None
+        self.running = False
+        self.wanted = []  # Pages the grid asked for, not yet sent to the worker
+        self.requested = set()
+        self.todo = []  # Pages to make in the background
+        self.failed = set()
+        self.closed = False
+        self.batch_done.connect(self._on_batch)
+
+    def reset(self, archive):
+        self.generation += 1
+        self.archive = archive
+        self.book_dir = self.cache.book_dir(archive)
+        self.cache.touch(archive)
+        self.pixmaps.clear()
+        self.running = False
+        self.wanted = []
+        self.requested = set()
+        self.todo = list(range(1, len(archive) + 1))
+        self.failed = set()
+        self._pump()
+
+    def pixmap(self, page):
+        """The thumbnail of page if it is in memory, else None and it is asked for."""
+        pixmap = self.pixmaps.get((page, THUMBNAIL_HEIGHT))
+        if pixmap is None and page not in self.failed:
+            self.request(page)
+        return pixmap
+
+    def request(self, page):
+        self.requested.add(page)
+        if page not in self.wanted:
+            self.wanted.append(page)
+            self._pump()
+
+    def _pump(self):
+        if self.running or self.archive is None or self.closed:
+            return
+        batch = []
+        while self.wanted and len(batch) < self.batch_size:
+            page = self.wanted.pop()
+            if (page, THUMBNAIL_HEIGHT) not in self.pixmaps:
+                batch.append(page)
+        while self.todo and len(batch) < self.batch_size:
+            page = self.todo.pop(0)
+            if page not in batch:
+                batch.append(page)
+        if not batch:
+            self.cache.evict()
+            return
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=lower_priority)
+        pages = [(page - 1, self.cache.path_for(self.archive, page - 1, book_dir=self.book_dir)) for page in batch]
+        self.running = True
+        future = self.executor.submit(thumbnail_pages, self.archive.path, pages)
+        future.add_done_callback(partial(self._on_done, self.generation))
+
+    def _on_done(self, generation, future):
+        # Called on an executor thread; the signal is queued to the GUI thread
+        if self.closed or future.cancelled():
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Thumbnails failed: {e}")
+            result = []
+        try:
+            self.batch_done.emit(generation, result)
+        except RuntimeError:
+            pass  # The window was destroyed while the batch finished
+
+    def _on_batch(self, generation, result):
+        if self.closed or generation != self.generation:
+            return  # Batch for a book that is no longer open
+        self.running = False
+        for page_index, data in result:
+            page = page_index + 1
+            if data is None:
+                self.failed.add(page)
+            elif page in self.requested:
+                pixmap = QPixmap()
+                if pixmap.loadFromData(data, "JPG"):
+                    self.pixmaps.put((page, THUMBNAIL_HEIGHT), pixmap)
+                    self.ready.emit(page)
+        self._pump()
+
+    def shutdown(self):
+        # A batch still running finishes later; it must not start the pool again
+        self.closed = True
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+class ThumbnailModel(QAbstractListModel):
+    """One row per page, decorated with its thumbnail once the loader has it."""
+
+    def __init__(self, loader, parent=None):
+        super().__init__(parent)
+        self.loader = loader
+        self.page_count = 0
+        loader.ready.connect(self._on_ready)
+
+    def set_page_count(self, page_count):
+        self.beginResetModel()
+        self.page_count = page_count
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.page_count
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return str(index.row() + 1)
+        if role == Qt.ItemDataRole.DecorationRole:
+            # Only rows the view paints get here, so visible pages are made first
+            return self.loader.pixmap(index.row() + 1)
+        return None
+
+    def _on_ready(self, page):
+        index = self.index(page - 1)
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+
+class PanelDetector(QObject):
+    """Runs panel detection for a book on a worker process pool.
+
+    Pages are detected in the order given to start(), the first one on its
+    own and the rest in batches, and each batch is delivered to the GUI
+    thread through pages_ready as soon as it finishes.
+    """
+    pages_ready = pyqtSignal(int, object)  # generation, process_pages() result
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.executor = None
+        self.generation = 0
+        self.futures = []
+        self.closed = False
+
+    def start(self, zip_path, page_order, engine=DEFAULT_ENGINE):
+        from panels import BATCH_SIZE, process_pages
+        self.cancel()
+        # The page on screen goes alone so it is not held up by its batch
+        batches = [page_order[:1]] + [page_order[i:i + BATCH_SIZE] for i in range(1, len(page_order), BATCH_SIZE)]
+        for batch in batches:
+            if not batch:
+                continue
+            if self.executor is None:
+                # Qt owns threads in this process, so workers must not be forked from it
+                self.executor = ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                                    mp_context=multiprocessing.get_context("spawn"))
+            try:
+                future = self.executor.submit(process_pages, zip_path, batch, engine)
+            except BrokenProcessPool:
+                # A worker process died, which breaks the whole pool; start over on a new one
+                self.executor.shutdown(wait=False)
+                self.executor = None
+                self.start(zip_path, page_order, engine)
+                return
+            future.add_done_callback(partial(self._on_done, self.generation, batch, time.perf_counter_ns()))
+            self.futures.append(future)
+
+    def _on_done(self, generation, batch, submitted, future):
+        # Called on an executor thread; the signal is queued to the GUI thread
+        if self.closed or future.cancelled():
+            return
+        # Workers are not instrumented, record the batch as seen from here
+        recorder.add("detect_batch", submitted, time.perf_counter_ns())
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Panel detection failed: {e}")
+            # Deliver the batch without panels, or its pages would stay pending for good
+            result = [(page_index, None, []) for page_index in batch]
+        try:
+            self.pages_ready.emit(generation, result)
+        except RuntimeError:
+            pass  # The window was destroyed while the batch finished
+
+    def cancel(self):
+        self.generation += 1
+        for future in self.futures:
+            future.cancel()
+        self.futures = []
+
+    def shutdown(self):
+        # Batches already running still finish, but are no longer delivered
+        self.closed = True
+        self.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
 
 
 class ComicViewer(QMainWindow):
-    def __init__(self):
+    def __init__(self, memory_budget_mb=None):
         super().__init__()
 
         self.setWindowTitle("Comic Viewer")
-        pygame.init()
         self.SESSION_FILE = "last_session.json"
+        self.SETTINGS_FILE = "settings.json"
+        self.settings = self.load_settings()
         self.scroll_position = 0
         self.version= "v 0.20"
         self.filename = ""
         self.page_number = 0
-        self.panel_number = ""
-        self.panel_surfaces = []
-        self.panel_info = []
+        self.panel_number = 1
+        self.panel_index = PanelIndex(0)
+        # Every image cache below counts towards one budget
+        self.memory = MemoryGovernor((memory_budget_mb or self.settings["memory_budget_mb"]) * MB)
+        self.page_cache = PageCache(self, self.memory.max_bytes, governor=self.memory)
+        self.panel_pyramid = PanelPyramid(self.page_cache, self, self.memory.max_bytes // 4, governor=self.memory)
+        self.thumbnails = ThumbnailLoader(self, self.memory.max_bytes // 8, governor=self.memory)
+        self.thumbnail_model = ThumbnailModel(self.thumbnails, self)
+        self.zoom_prefetch_timer = QTimer(self)
+        self.zoom_prefetch_timer.setSingleShot(True)
+        self.zoom_prefetch_timer.setInterval(250)
+        self.zoom_prefetch_timer.timeout.connect(self.prefetch_zoom_levels)
+        # Resizing shows a stretched copy of the last view, rendered properly once it settles
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.setInterval(150)
+        self.resize_timer.timeout.connect(self.on_resize_settled)
+        self.resize_source = None
+        # Width scroll_position is measured at in fit-width view
+        self.strip_width = 0
+        self.reading_direction = 1
         self.setStyleSheet("background-color: black;")
-        self.screen_width = 800
-        self.screen_height = 600
-        self.menu_height = 50
         self.zoom_factor = 1.0
-        self.label = QLabel("No file opened.")
+        self.label = PageLabel("No file opened.")
         self.label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+        # Zoomed panels may be larger than the view; they are clipped, the window does not grow
+        self.label.setSizePolicy(QSizePolicy.Policy.Ignored, QSizePolicy.Policy.Ignored)
+        self.label.resized.connect(self.on_label_resized)
         self.image_files = []
+        self.archive = None
+        self.awaiting_page = None
+        # Show the last panel of the awaited page rather than the first, when stepping backwards
+        self.awaiting_last_panel = False
+        self.panel_cache = PanelIndexCache()
+        self.page_boxes = {}
+        self.page_boxes_dirty = False
+        self.detector = PanelDetector(self)
+        self.detector.pages_ready.connect(self.on_pages_ready)
         self.prev_button = QPushButton("Previous")
         self.next_button = QPushButton("Next")
         # Make buttons visible in grey with white text
@@ -45,8 +725,22 @@ class ComicViewer(QMainWindow):
         self.prev_button.clicked.connect(self.show_previous_panel)
         self.next_button.clicked.connect(self.show_next_panel)
 
+        # Page overview grid, shown in place of the label
+        self.overview = QListView()
+        self.overview.setViewMode(QListView.ViewMode.IconMode)
+        self.overview.setIconSize(QSize(THUMBNAIL_HEIGHT * 2 // 3, THUMBNAIL_HEIGHT))
+        self.overview.setGridSize(QSize(THUMBNAIL_HEIGHT * 2 // 3 + 24, THUMBNAIL_HEIGHT + 32))
+        self.overview.setResizeMode(QListView.ResizeMode.Adjust)
+        self.overview.setMovement(QListView.Movement.Static)
+        self.overview.setUniformItemSizes(True)
+        self.overview.setStyleSheet("color: white; background-color: black;")
+        self.overview.setModel(self.thumbnail_model)
+        self.overview.clicked.connect(self.on_thumbnail_clicked)
+        self.overview.hide()
+
         image_layout = QVBoxLayout()
         image_layout.addWidget(self.label)
+        image_layout.addWidget(self.overview)
 
         nav_layout = QHBoxLayout()
         ## hiding the navigation buttons
@@ -65,55 +759,108 @@ class ComicViewer(QMainWindow):
         container.setLayout(main_layout)
         self.setCentralWidget(container)
         self.menuBar().setStyleSheet("background-color: gray;")
+        self.stats_overlay = QLabel(container)
+        self.stats_overlay.setStyleSheet("color: #7CFC00; background-color: rgba(0, 0, 0, 170); font-family: monospace; padding: 6px;")
+        self.stats_overlay.hide()
+        self.stats_timer = QTimer(self)
+        self.stats_timer.setInterval(500)
+        self.stats_timer.timeout.connect(self.update_stats_overlay)
+        # PANEL_VIEWER_TRACE=path records from startup and writes a Chrome trace there on exit
+        self.trace_path = os.environ.get("PANEL_VIEWER_TRACE")
+        recorder.enabled = bool(self.trace_path)
         self.create_menus()
         self.update_title()
 
-    def save_last_session(self):        
+    def load_settings(self):
+        settings = {"detection_engine": DEFAULT_ENGINE, "memory_budget_mb": DEFAULT_MEMORY_BUDGET_MB}
+        if os.path.exists(self.SETTINGS_FILE):
+            try:
+                with open(self.SETTINGS_FILE, "r", encoding="utf-8") as f:
+                    settings.update(json.load(f))
+            except Exception as e:
+                print(f"Failed to load settings: {e}")
+        if settings["detection_engine"] not in ENGINES:
+            settings["detection_engine"] = DEFAULT_ENGINE
+        if not isinstance(settings["memory_budget_mb"], int) or settings["memory_budget_mb"] <= 0:
+            settings["memory_budget_mb"] = DEFAULT_MEMORY_BUDGET_MB
+        return settings
+
+    def save_settings(self):
+        try:
+            with open(self.SETTINGS_FILE, "w", encoding="utf-8") as f:
+                json.dump(self.settings, f, ensure_ascii=False, indent=4)
+        except OSError as e:
+            print(f"Failed to save settings: {e}")
+
+    def reading_mode(self):
+        if self.reading_menu_panel_action.isChecked():
+            return "panel"
+        if self.reading_menu_page_action.isChecked():
+            return "page"
+        return "fit_width"
+
+    def set_reading_mode(self, mode):
+        actions = {
+            "panel": self.reading_menu_panel_action,
+            "page": self.reading_menu_page_action,
+            "fit_width": self.reading_menu_fit_width_action,
+        }
+        actions.get(mode, self.reading_menu_fit_width_action).trigger()
+
+    def save_last_session(self):
         if not hasattr(self, "full_file_path") or not self.full_file_path:
             return  # Skip saving if no file is open
 
-        windows_path = self.full_file_path
         data = {
-            "filename": windows_path,
-            "page_number": self.page_number
+            "filename": self.full_file_path,
+            "page_number": self.page_number,
+            "panel_number": self.panel_number,
+            "reading_mode": self.reading_mode(),
+            "scroll_position": self.scroll_position,
+            "zoom_factor": self.zoom_factor,
+            # Label size the view was drawn at; scroll_position is in its fit-width pixels
+            "view_size": [self.label.width(), self.label.height()],
         }
+        # A snapshot of the view, painted on resume while the book is reopened
+        pixmap = self.label.pixmap()
+        if pixmap is not None and not pixmap.isNull():
+            preview_path = default_cache_dir("session", "last_view.png")
+            try:
+                os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+                if pixmap.save(preview_path, "PNG"):
+                    data["preview"] = preview_path
+            except OSError as e:
+                print(f"Failed to save session preview: {e}")
         with open(self.SESSION_FILE, "w", encoding="utf-8") as f:
             json.dump(data, f, ensure_ascii=False, indent=4)
 
     def load_last_session(self):
+        if not os.path.exists(self.SESSION_FILE):
+            return
+        try:
+            with open(self.SESSION_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            file_path = data.get("filename", "")
+            if not os.path.exists(file_path):
+                self.label.setText(f"Last book not found: {file_path}")
+                return
 
-        if os.path.exists(self.SESSION_FILE):
-            try:
-                with open(self.SESSION_FILE, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-
-                    self.full_file_path = data.get("filename", "")
-                    self.page_number = data.get("page_number", 1)
-                    self.filename = os.path.basename(self.full_file_path)
-                    print(self.full_file_path)
-                    print(self.filename)
-                    print(self.page_number)
-                    self.panel_number = data.get("panel_number", 1)
-
-                    # Show loading message
-                    self.label.setText("Loading comic book...")
-                    self.label.setStyleSheet("color: grey; background-color: black;")
-                    self.label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-                    QApplication.processEvents()  # Force UI to update immediately
-
-                    self.panel_surfaces, self.panel_info = self.extract_and_process_panels(self.full_file_path)
-                    self.update_title()
-                    #self.show_next_panel()
-                    self.simulate_scroll_down()
-
-
-            except Exception as e:
-                print(f"Failed to load session: {e}")
-                self.filename = ""
-                self.page_number = 1
-        else:
-            self.filename = ""
-            self.page_number = 0
+            view_size = data.get("view_size") or [self.label.width(), self.label.height()]
+            self.zoom_factor = data.get("zoom_factor", 1.0)
+            self.set_reading_mode(data.get("reading_mode", "fit_width"))
+            preview = data.get("preview")
+            show_preview = (preview and view_size == [self.label.width(), self.label.height()]
+                            and os.path.exists(preview))
+            if show_preview:
+                # Paint the last view at once, the real one replaces it when the book is open
+                self.label.setPixmap(QPixmap(preview))
+                QApplication.processEvents()
+            # Fit-width offsets scale with the width the page is shown at
+            scroll_position = round(data.get("scroll_position", 0) * self.label.width() / max(1, view_size[0]))
+            self.open_path(file_path, data.get("page_number", 1), data.get("panel_number", 1), scroll_position,
+                           show_loading=not show_preview)
+        except Exception as e:
+            print(f"Failed to load session: {e}")
 
     def create_menus(self):
         menubar = self.menuBar()
@@ -138,6 +885,14 @@ class ComicViewer(QMainWindow):
         display_menu.addAction(self.display_filename_action)
         display_menu.addAction(self.display_page_action)
         display_menu.addAction(self.display_panel_action)
+
+        display_menu.addSeparator()
+        self.display_stats_action = QAction("Show Performance Stats", self, checkable=True)
+        self.display_stats_action.triggered.connect(self.set_stats_overlay)
+        display_menu.addAction(self.display_stats_action)
+        export_trace_action = QAction("Export Performance Trace...", self)
+        export_trace_action.triggered.connect(self.export_trace)
+        display_menu.addAction(export_trace_action)
         
         reading_menu = menubar.addMenu("Reading Mode")
 
@@ -180,119 +935,235 @@ class ComicViewer(QMainWindow):
         reading_menu.addAction(self.reading_menu_page_action)
         reading_menu.addAction(self.reading_menu_fit_width_action)
 
+        reading_menu.addSeparator()
+        self.overview_action = QAction("Page Overview", self, checkable=True)
+        self.overview_action.setShortcut("G")
+        self.overview_action.triggered.connect(self.set_overview)
+        reading_menu.addAction(self.overview_action)
+
+        reading_menu.addSeparator()
+        detection_menu = reading_menu.addMenu("Panel Detection")
+        engine_names = {"contour": "Contours", "xycut": "Gutters (XY-cut)"}
+        self.detection_engine_actions = {}
+        for engine in ENGINES:
+            action = QAction(engine_names[engine], self, checkable=True)
+            action.setChecked(engine == self.settings["detection_engine"])
+            action.triggered.connect(partial(self.set_detection_engine, engine))
+            detection_menu.addAction(action)
+            self.detection_engine_actions[engine] = action
+
         
         # Add version label to the right side of the menu bar
         version_label = QLabel(self.version)
         version_label.setStyleSheet("color: white; margin-left: auto; padding: 5px;")
         menubar.setCornerWidget(version_label, Qt.Corner.TopRightCorner)
 
+    def set_stats_overlay(self, checked):
+        # Spans are only recorded while the overlay is up, or for a trace asked for at startup
+        recorder.enabled = checked or bool(self.trace_path)
+        self.stats_overlay.setVisible(checked)
+        if checked:
+            self.update_stats_overlay()
+            self.stats_timer.start()
+        else:
+            self.stats_timer.stop()
+
+    def cache_stats(self):
+        return {
+            "page_cache": self.page_cache.images.stats(),
+            "tile_cache": self.page_cache.tiles.stats(),
+            "page_pixmap_cache": self.page_cache.page_pixmaps.stats(),
+            "panel_cache": self.panel_pyramid.pixmaps.stats(),
+            "thumbnail_cache": self.thumbnails.pixmaps.stats(),
+        }
+
+    def update_stats_overlay(self):
+        lines = [f"{'last ' + str(int(STATS_WINDOW)) + ' s':<13}{'n':>5}{'avg ms':>9}{'max ms':>9}"]
+        stats = recorder.stats(STATS_WINDOW)
+        for name in PIPELINE_STAGES:
+            if name in stats:
+                count, total, longest = stats[name]
+                lines.append(f"{name:<13}{count:>5}{total / count:>9.1f}{longest:>9.1f}")
+        lines.append("")
+        for name, cache in self.cache_stats().items():
+            lookups = cache["hits"] + cache["misses"]
+            hit_rate = 100 * cache["hits"] / lookups if lookups else 0.0
+            lines.append(f"{name:<18}{hit_rate:>4.0f}% hits {cache['bytes'] / MB:>5.0f}/{cache['max_bytes'] / MB:.0f} MB")
+        memory = self.memory.stats()
+        lines.append(f"memory {memory['bytes'] / MB:.0f}/{memory['max_bytes'] / MB:.0f} MB, {memory['evictions']} evicted")
+        counters = recorder.counters
+        lines.append(f"decoded {counters.get('decoded_bytes', 0) / MB:.0f} MB, "
+                     f"inflated {counters.get('inflated_bytes', 0) / MB:.0f} MB, "
+                     f"pixmaps {counters.get('pixmap_bytes', 0) / MB:.0f} MB")
+        peak_rss = peak_rss_bytes()
+        if peak_rss is not None:
+            lines.append(f"peak RSS {peak_rss / MB:.0f} MB")
+        self.stats_overlay.setText("\n".join(lines))
+        self.stats_overlay.adjustSize()
+        self.stats_overlay.move(8, 8)
+        self.stats_overlay.raise_()
+
+    def export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Performance Trace", "panel_viewer_trace.json",
+                                              filter="Chrome trace (*.json)")
+        if path:
+            self.write_trace(path)
+
+    def write_trace(self, path):
+        try:
+            recorder.export_chrome_trace(path, self.cache_stats())
+        except OSError as e:
+            print(f"Failed to write trace: {e}")
+
+    def set_detection_engine(self, engine, checked=True):
+        for name, action in self.detection_engine_actions.items():
+            action.setChecked(name == engine)
+        if engine == self.settings["detection_engine"]:
+            return
+        self.store_panel_index()
+        self.settings["detection_engine"] = engine
+        self.save_settings()
+        if self.archive is not None:
+            # Panels are numbered differently by each engine, restart on this page
+            self.panel_number = 1
+            self.start_panel_detection(self.full_file_path)
+            self.update_title()
+
     def open_file(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select Comic Book", filter="CBZ files (*.cbz);;ZIP files (*.zip)")
         if file_path:
-            self.full_file_path = file_path
-            self.filename = os.path.basename(file_path)
-            self.full_file_path = file_path
-            self.page_number = 1
-            self.panel_number = 1
-            print(self.full_file_path)
-            print(self.filename)
-            print(self.page_number)
-            
+            self.open_path(file_path)
+
+    def open_path(self, file_path, page_number=1, panel_number=1, scroll_position=0, show_loading=True,
+                  archive=None):
+        """Open a book at a position. archive is the book already opened by load_archive(), if it was."""
+        self.full_file_path = file_path
+        self.filename = os.path.basename(file_path)
+        self.page_number = page_number
+        self.panel_number = panel_number
+        self.scroll_position = scroll_position
+        self.strip_width = self.label.width()
+
+        if show_loading:
             # Show loading message
             self.label.setText("Loading comic book...")
             self.label.setStyleSheet("color: grey; background-color: black;")
             self.label.setAlignment(Qt.AlignmentFlag.AlignCenter)
             QApplication.processEvents()  # Force UI to update immediately
 
-
-            self.panel_surfaces, self.panel_info = self.extract_and_process_panels(file_path)
+        self.start_panel_detection(file_path, archive)
+        if not self.reading_menu_panel_action.isChecked():
             self.display_panel()
 
+        self.update_title()
 
-            self.update_title()
-
-    def extract_and_process_panels(self, zip_path):
-        extract_dir = 'extracted_images'
-
-        # Clear the extraction directory if it exists
-        if os.path.exists(extract_dir):
-            shutil.rmtree(extract_dir)
-        os.makedirs(extract_dir)
-
-        # Extract all contents of the ZIP file
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
-
-        # Recursively collect image files from all subdirectories
-        self.image_files = []
-        for root, dirs, files in os.walk(extract_dir):
-            for file in files:
-                if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
-                    self.image_files.append(os.path.join(root, file))
+    def open_archive(self, zip_path, archive=None):
+        if self.archive is not None:
+            self.archive.close()
+        # Pages are listed from the central directory and decoded in memory
+        self.archive = archive if archive is not None else load_archive(zip_path)
+        self.page_cache.reset(self.archive)
+        self.thumbnails.reset(self.archive)
+        self.thumbnail_model.set_page_count(len(self.archive))
+        self.image_files = [info.filename for info in self.archive.members]
+
+    def render_panel(self, record):
+        """Return the pixmap for a panel at the current zoom, fitted into the view."""
+        return self.panel_pyramid.level(record, self.label.size(), self.zoom_factor)
+
+    def prefetch_panels(self, record):
+        """Render the next panel in the background, and the zoom steps either side of this one once idle."""
+        position = (self.panel_index.next if self.reading_direction >= 0 else self.panel_index.previous)(
+            record.page, record.panel)
+        if position is not None:
+            self.panel_pyramid.prefetch([(self.panel_index.get(*position), self.label.size(), self.zoom_factor)])
+        # Only worth it if the reader stays on this panel, so wait for a pause
+        self.zoom_prefetch_timer.start()
+
+    def prefetch_zoom_levels(self):
+        record = self.panel_index.get(self.page_number, self.panel_number)
+        if record is None or not self.reading_menu_panel_action.isChecked():
+            return
+        view_size = self.label.size()
+        self.panel_pyramid.prefetch([(record, view_size, zoom) for zoom in (self.zoom_factor + 0.1, self.zoom_factor - 0.1)
+                                     if 0.5 <= round(zoom, 1) <= 2.5])
+
+    def start_panel_detection(self, zip_path, archive=None):
+        """Open the archive and detect its panels in the background, current page first."""
+        self.store_panel_index()
+        self.open_archive(zip_path, archive)
+        page_count = len(self.archive)
+        self.panel_index = PanelIndex(page_count)
+        self.panel_pyramid.reset()
+        # Pages already in the panel index are not sent to the workers at all
+        self.page_boxes = self.panel_cache.load(self.archive, self.settings["detection_engine"])
+        self.page_boxes_dirty = False
+        for page_index, (size, boxes) in self.page_boxes.items():
+            self.panel_index.add_page(page_index + 1, boxes)
+
+        current = min(max(self.page_number, 1), max(page_count, 1)) - 1
+        page_order = [page_index for page_index in detection_order(current, page_count)
+                      if page_index not in self.page_boxes]
+        self.awaiting_page = current + 1
+        self.awaiting_last_panel = False
+        self.detector.start(zip_path, page_order, self.settings["detection_engine"])
+        self.show_awaited_page()
+
+    def store_panel_index(self):
+        if self.archive is not None and self.page_boxes_dirty:
+            self.panel_cache.store(self.archive, self.page_boxes, self.settings["detection_engine"])
+            self.page_boxes_dirty = False
+
+    def on_pages_ready(self, generation, results):
+        if generation != self.detector.generation:
+            return  # Result for a book that is no longer open
+        for page_index, size, boxes in results:
+            if size is not None and page_index not in self.page_boxes:
+                self.page_boxes[page_index] = (size, boxes)
+                self.page_boxes_dirty = True
+            self.panel_index.add_page(page_index + 1, boxes)
+        if not self.panel_index.pending_count:
+            self.store_panel_index()
+        self.show_awaited_page()
+        self.update_title()
 
+    def show_awaited_page(self):
+        """Show the page the reader is waiting on once its panels are known."""
+        if self.awaiting_page is None:
+            return
+        if self.awaiting_last_panel:
+            stop = self.panel_index.last_stop(self.awaiting_page)
+        else:
+            stop = self.panel_index.first_stop(self.awaiting_page)
+        if self.panel_index.is_pending(stop):
+            # Pages without panels in front of it were skipped, keep waiting on this one
+            self.awaiting_page = stop
+            return
+        self.awaiting_page = None
+        if 1 <= stop <= self.panel_index.page_count and self.reading_menu_panel_action.isChecked():
+            if self.awaiting_last_panel:
+                self.page_number, self.panel_number = stop, len(self.panel_index.panels_on(stop))
+            elif stop != self.page_number or self.panel_index.get(stop, self.panel_number) is None:
+                self.page_number, self.panel_number = stop, 1
+            self.display_panel()
 
-        panel_surfaces = []
-        panel_info = []
-        for page_index, image_path in enumerate(sorted(self.image_files)):
-            image = cv2.imread(image_path)
-            if image is None:
-                continue
-            image_resized, panel_boxes_sorted = self.detect_panels(image)
-            for panel_index, (x, y, w, h) in enumerate(panel_boxes_sorted):
-                panel = image_resized[y:y+h, x:x+w]
-                scale_factor = min(self.screen_width / w, (self.screen_height - self.menu_height) / h, 1.0)
-                panel_resized = cv2.resize(panel, (int(w * scale_factor), int(h * scale_factor)))
-                panel_rgb = cv2.cvtColor(panel_resized, cv2.COLOR_BGR2RGB)
-                panel_surface = pygame.surfarray.make_surface(np.transpose(panel_rgb, (1, 0, 2)))
-                panel_surfaces.append(panel_surface)
-                panel_info.append((os.path.basename(zip_path), page_index + 1, panel_index + 1))
-        return panel_surfaces, panel_info
-
-    def detect_panels(self, image):
-        height, width = image.shape[:2]
-        max_dim = 4000
-        scale = max_dim / max(height, width)
-        image_resized = cv2.resize(image, (int(width * scale), int(height * scale)))
-
-        gray = cv2.cvtColor(image_resized, cv2.COLOR_BGR2GRAY)
-        _, thresh = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY)
-        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (1, 1))
-        morphed = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-        inverted = cv2.bitwise_not(morphed)
-        contours, _ = cv2.findContours(inverted, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        panel_boxes = []
-        for cnt in contours:
-            x, y, w, h = cv2.boundingRect(cnt)
-            if w * h > 10000:
-                panel_boxes.append((x, y, w, h))
-
-        def sort_panels(boxes, row_tolerance=30):
-            boxes = sorted(boxes, key=lambda b: b[1])
-            rows, current_row = [], []
-            for box in boxes:
-                if not current_row or abs(box[1] - current_row[0][1]) < row_tolerance:
-                    current_row.append(box)
-                else:
-                    rows.append(sorted(current_row, key=lambda b: b[0]))
-                    current_row = [box]
-            if current_row:
-                rows.append(sorted(current_row, key=lambda b: b[0]))
-            return [box for row in rows for box in row]
-
-        return image_resized, sort_panels(panel_boxes)
+    def go_to_panel(self, position):
+        """Move to a (page, panel) position returned by the panel index."""
+        self.page_number, self.panel_number = position
+        self.awaiting_page = None
+        self.display_panel()
+
+    def wait_for_page(self, page_number, last_panel=False):
+        """Show page_number as soon as detection reaches it, at its last panel if last_panel."""
+        self.awaiting_page = page_number
+        self.awaiting_last_panel = last_panel
+        self.show_awaited_page()
+        self.update_title()
 
     def display_panel(self):
+        self.memory.set_position(self.page_number, self.reading_direction)
         if (self.reading_menu_page_action.isChecked() or self.reading_menu_fit_width_action.isChecked()):
             # Full Page View
-            extract_dir = 'extracted_images'
-        # Recursively collect image files from all subdirectories
-            #image_files = []
-            #for root, dirs, files in os.walk(extract_dir):
-            #    for file in files:
-            #        if file.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp')):
-            #            self.image_files.append(os.path.join(root, file))
-
             if not self.image_files:
                 self.label.setText("No JPG images found.")
                 return
@@ -301,79 +1172,195 @@ class ComicViewer(QMainWindow):
             
             # Use current page number instead of always showing the first image
             current_index = max(0, self.page_number - 1)
-            first_image_path = sorted(self.image_files)[current_index]
-
-            print(first_image_path)
-            image = cv2.imread(first_image_path)
-            if image is None:
-                self.label.setText("Failed to load image.")
-                return
-
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            height, width, channel = image_rgb.shape
-            bytes_per_line = 3 * width
-            q_image = QImage(image_rgb.data, width, height, bytes_per_line, QImage.Format.Format_RGB32)
-            pixmap = QPixmap.fromImage(q_image)
-
 
             # Conditionally scale to fit screen width
             if self.reading_menu_fit_width_action.isChecked():
-                screen_width = self.size().width()  # or use self.size().width() for full window
-                pixmap = pixmap.scaledToWidth(screen_width, Qt.TransformationMode.SmoothTransformation)
-                #pixmap = pixmap.scaledToHeight(self.size().height() - self.menu_height, Qt.TransformationMode.SmoothTransformation)
-                print('Scaling to fit width:', screen_width)
-
-
-            label_size = self.label.size()
-            scaled_pixmap = pixmap.scaled(label_size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-            self.label.setPixmap(scaled_pixmap)
+                # The book is one strip, shown from scroll_position rows into the current page
+                self.render_strip()
+            else:
+                scaled_pixmap = self.page_cache.fit_page(current_index + 1, self.label.size())
+                if scaled_pixmap is None:
+                    self.label.setText("Failed to load image.")
+                    return
+                self.label.setPixmap(scaled_pixmap)
         else:
             # Panel View
-            if not self.panel_surfaces:
-                self.label.setText("No panels to display.")
+            record = self.panel_index.get(self.page_number, self.panel_number)
+            if record is None:
+                position = self.panel_index.jump_to_page(self.page_number) or self.panel_index.jump_to_page(1)
+                if position is None:
+                    self.label.setText("No panels to display.")
+                    return
+                self.page_number, self.panel_number = position
+                record = self.panel_index.get(*position)
+
+            pixmap = self.render_panel(record)
+            if pixmap is None:
+                self.label.setText("Failed to load image.")
                 return
-
-            index = 0
-            for i, info in enumerate(self.panel_info):
-                if info[1] == self.page_number and info[2] == self.panel_number:
-                    index = i
-                    break
-
-            surface = self.panel_surfaces[index]
-            width, height = surface.get_size()
-            image = QImage(surface.get_buffer(), width, height, QImage.Format.Format_RGB32)
-            pixmap = QPixmap.fromImage(image)
-
-            if hasattr(self, 'zoom_factor') and self.zoom_factor != 1.0:
-                new_width = int(width * self.zoom_factor)
-                new_height = int(height * self.zoom_factor)
-                pixmap = pixmap.scaled(new_width, new_height, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-
+            # Zoom picks another level of the panel's pyramid rather than rescaling this one
             self.label.setPixmap(pixmap)
+            self.prefetch_panels(record)
 
         self.update_title()
 
+    def rescale_strip(self, width):
+        """Keep scroll_position on the same rows of the page when the strip is shown at another width."""
+        if self.strip_width and width != self.strip_width:
+            self.scroll_position = round(self.scroll_position * width / self.strip_width)
+        self.strip_width = width
+
+    def render_strip(self):
+        """Paint the fit-width tiles under the viewport and prefetch the ones around it."""
+        width, height = self.label.width(), self.label.height()
+        self.rescale_strip(width)
+        self.memory.set_position(self.page_number, self.reading_direction)
+        canvas = QPixmap(width, height)
+        canvas.fill(Qt.GlobalColor.black)
+        painter = QPainter(canvas)
+        for page, index, y in self.page_cache.strip_tiles(self.page_number, self.scroll_position, width, height):
+            tile = self.page_cache.tile(page, width, index)
+            if tile is not None:
+                painter.drawPixmap(0, y, tile)
+        painter.end()
+        self.label.setPixmap(canvas)
+        self.page_cache.prefetch_strip(self.page_number, self.scroll_position, width, height, self.reading_direction)
+
+    def scroll_strip(self, delta):
+        """Scroll the fit-width strip by delta rows, across page ends, stopping at either end of the book."""
+        width, height = self.label.width(), self.label.height()
+        self.rescale_strip(width)
+        page, offset = self.page_cache.strip_position(self.page_number, self.scroll_position + delta, width)
+        # Keep the end of the last page at the bottom of the view
+        end_page, end_offset = self.page_cache.strip_position(page, offset + height, width)
+        overflow = end_offset - self.page_cache.page_height(end_page, width)
+        if end_page == len(self.image_files) and overflow > 0:
+            page, offset = self.page_cache.strip_position(page, offset - overflow, width)
+        self.page_number, self.scroll_position = page, offset
+
+    def on_label_resized(self, old_size):
+        if self.archive is None or not self.label.isVisible():
+            return
+        if self.resize_source is None:
+            pixmap = self.label.pixmap()
+            if pixmap is not None and not pixmap.isNull() and not old_size.isEmpty():
+                # Every preview of this resize is stretched from the last full render
+                self.resize_source = (pixmap, old_size)
+        if self.resize_source is not None:
+            self.show_resize_preview()
+        self.resize_timer.start()
+
+    def show_resize_preview(self):
+        """Stretch the last full render to the label's new size, quickly and roughly."""
+        pixmap, old_size = self.resize_source
+        width, height = self.label.width(), self.label.height()
+        if width <= 0 or height <= 0:
+            return
+        fast = Qt.TransformationMode.FastTransformation
+        if self.reading_menu_fit_width_action.isChecked():
+            # The strip scales with the width and keeps its top row at the top
+            canvas = QPixmap(width, height)
+            canvas.fill(Qt.GlobalColor.black)
+            painter = QPainter(canvas)
+            painter.drawPixmap(0, 0, pixmap.scaledToWidth(width, fast))
+            painter.end()
+            self.label.setPixmap(canvas)
+        else:
+            factor = min(width / old_size.width(), height / old_size.height())
+            self.label.setPixmap(pixmap.scaled(max(1, round(pixmap.width() * factor)),
+                                               max(1, round(pixmap.height() * factor)),
+                                               Qt.AspectRatioMode.IgnoreAspectRatio, fast))
+
+    def on_resize_settled(self):
+        """Render the view at the new size, drop renders for other sizes and prefetch around it."""
+        self.resize_source = None
+        if self.archive is None or not self.label.isVisible():
+            return
+        if self.reading_menu_panel_action.isChecked() and self.awaiting_page is not None:
+            return  # Drawn at the new size once its panels arrive
+        view_size = self.label.size()
+        self.page_cache.discard_other_sizes(view_size)
+        self.panel_pyramid.discard_other_sizes(view_size)
+        # Fit width and panel view prefetch around the view as they render
+        self.display_panel()
+        if self.reading_menu_page_action.isChecked():
+            self.page_cache.prefetch(self.page_number, self.reading_direction, size=view_size)
+
     def show_next_panel(self):
         if self.reading_menu_page_action.isChecked():
             # Full page mode: no next page implemented
             return
-        for i, info in enumerate(self.panel_info):
-            if info[1] == self.page_number and info[2] == self.panel_number:
-                if i + 1 < len(self.panel_info):
-                    self.page_number, self.panel_number = self.panel_info[i + 1][1], self.panel_info[i + 1][2]
-                    self.display_panel()
-                break
+        if self.archive is None:
+            return  # No book open
+        self.reading_direction = 1
+        position = self.panel_index.next(self.page_number, self.panel_number)
+        if position is not None:
+            self.go_to_panel(position)
+        elif self.panel_index.is_pending(self.panel_index.first_stop(self.page_number + 1)):
+            # The next page is still being detected, show it when it arrives
+            self.wait_for_page(self.page_number + 1)
 
     def show_previous_panel(self):
         if self.reading_menu_page_action.isChecked():
             # Full page mode: no previous page implemented
             return
-        for i, info in enumerate(self.panel_info):
-            if info[1] == self.page_number and info[2] == self.panel_number:
-                if i - 1 >= 0:
-                    self.page_number, self.panel_number = self.panel_info[i - 1][1], self.panel_info[i - 1][2]
-                    self.display_panel()
-                break
+        if self.archive is None:
+            return  # No book open
+        self.reading_direction = -1
+        position = self.panel_index.previous(self.page_number, self.panel_number)
+        if position is not None:
+            self.go_to_panel(position)
+        elif self.panel_index.is_pending(self.panel_index.last_stop(self.page_number - 1)):
+            # The previous page is still being detected, show its last panel when it arrives
+            self.wait_for_page(self.page_number - 1, last_panel=True)
+
+    def show_first_panel(self):
+        self.show_page_panels(1)
+
+    def show_last_panel(self):
+        position = self.panel_index.last()
+        if position is not None:
+            self.go_to_panel(position)
+        elif self.panel_index.is_pending(self.panel_index.last_stop(self.panel_index.page_count)):
+            self.wait_for_page(self.panel_index.page_count, last_panel=True)
+
+    def show_page_panels(self, page_number):
+        """Jump to the first panel of page_number, waiting for it if it is still being detected."""
+        position = self.panel_index.jump_to_page(page_number)
+        if position is not None:
+            self.go_to_panel(position)
+        else:
+            self.wait_for_page(page_number)
+
+    def go_to_page(self, page_number):
+        """Show page_number in the current reading mode, its first panel in panel view."""
+        if self.reading_menu_panel_action.isChecked():
+            self.show_page_panels(page_number)
+        else:
+            self.page_number, self.scroll_position = page_number, 0
+            self.display_panel()
+
+    def set_overview(self, visible):
+        visible = visible and self.archive is not None
+        self.overview_action.setChecked(visible)
+        # Hide before show, or the layout briefly shares the space and squashes the label
+        if visible:
+            self.label.hide()
+            self.overview.show()
+        else:
+            self.overview.hide()
+            self.label.show()
+        if visible:
+            current = self.thumbnail_model.index(max(0, self.page_number - 1))
+            self.overview.setCurrentIndex(current)
+            self.overview.scrollTo(current, QListView.ScrollHint.PositionAtCenter)
+            self.overview.setFocus()
+        else:
+            self.setFocus()
+
+    def on_thumbnail_clicked(self, index):
+        self.set_overview(False)
+        self.go_to_page(index.row() + 1)
 
     def update_title(self):
         parts = []
@@ -381,6 +1368,8 @@ class ComicViewer(QMainWindow):
             parts.append(self.filename)
         if self.display_page_action.isChecked():
             parts.append(f"Page {self.page_number} / {len(self.image_files)}")
+        if self.panel_index.pending_count:
+            parts.append(f"Detecting panels {self.panel_index.page_count - self.panel_index.pending_count} / {self.panel_index.page_count}")
         if self.reading_menu_page_action.isChecked():
             parts.append(f"Full Page View")
         else:
@@ -393,18 +1382,30 @@ class ComicViewer(QMainWindow):
         try:
             key = event.key()
             text = event.text()
+            if self.overview.isVisible():
+                if key == Qt.Key.Key_Escape:
+                    self.set_overview(False)
+                elif key in (Qt.Key.Key_Return, Qt.Key.Key_Enter) and self.overview.currentIndex().isValid():
+                    self.on_thumbnail_clicked(self.overview.currentIndex())
+                return
             if self.reading_menu_page_action.isChecked() or self.reading_menu_fit_width_action.isChecked():
                 return  # Ignore key events in Full Page View
             if key == Qt.Key.Key_Right:
                 self.show_next_panel()
             elif key == Qt.Key.Key_Left:
                 self.show_previous_panel()
+            elif key == Qt.Key.Key_Home:
+                self.show_first_panel()
+            elif key == Qt.Key.Key_End:
+                self.show_last_panel()
             elif (text == '+' or key == Qt.Key.Key_Plus) and not self.reading_menu_page_action.isChecked():
                 self.zoom_factor = min(2.5, self.zoom_factor + 0.1)
                 self.display_panel()
+                self.prefetch_zoom_levels()
             elif (text == '-' or key == Qt.Key.Key_Minus) and not self.reading_menu_page_action.isChecked():
                 self.zoom_factor = max(0.5, self.zoom_factor - 0.1)
                 self.display_panel()
+                self.prefetch_zoom_levels()
             else:
                 super().keyPressEvent(event)
         except Exception as e:
@@ -413,89 +1414,30 @@ class ComicViewer(QMainWindow):
     def wheelEvent(self, event):
         if (self.reading_menu_page_action.isChecked() or self.reading_menu_fit_width_action.isChecked()):
             # Full Page View navigation
-            #extract_dir = 'extracted_images'
-            #self.image_files = sorted([f for f in os.listdir(extract_dir) if f.lower().endswith('.jpg')])
-            
-
-            extract_dir = 'extracted_images'
-            self.image_files = sorted([
-                os.path.join(root, file)
-                for root, _, files in os.walk(extract_dir)
-                for file in files
-                if file.lower().endswith('.jpg')
-            ])
-
-            if not self.image_files or not self.image_files[self.page_number - 1]:
-                return
-
-            image_path = self.image_files[self.page_number - 1]
-            image = cv2.imread(image_path)
-            if image is None:
+            if not self.image_files or not 1 <= self.page_number <= len(self.image_files):
                 return
 
-            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            height, width, _ = image_rgb.shape
-            bytes_per_line = 3 * width
-            q_image = QImage(image_rgb.data, width, height, bytes_per_line, QImage.Format.Format_RGB888)
-            pixmap = QPixmap.fromImage(q_image)
-
             if self.reading_menu_fit_width_action.isChecked():
-                label_width = self.label.width()
-                scaled_pixmap = pixmap.scaledToWidth(label_width, Qt.TransformationMode.SmoothTransformation)
-                scaled_height = scaled_pixmap.height()
-                visible_height = self.label.height()
                 scroll_step = 100
-                max_scroll = max(0, scaled_height - visible_height)
-
-                if event.angleDelta().y() > 0:
-                    if self.scroll_position > 0:
-                        self.scroll_position = max(0, self.scroll_position - scroll_step)
-                    else:
-                        # Only switch page if already at top
-                        if self.page_number > 1:
-                            self.page_number -= 1
-                            # Load new image and scroll to bottom
-                            image_path = self.image_files[self.page_number - 1]
-                            image = cv2.imread(image_path)
-                            image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                            height, width, _ = image_rgb.shape
-                            q_image = QImage(image_rgb.data, width, height, 3 * width, QImage.Format.Format_RGB888)
-                            pixmap = QPixmap.fromImage(q_image)
-                            scaled_pixmap = pixmap.scaledToWidth(self.label.width(), Qt.TransformationMode.SmoothTransformation)
-                            self.scroll_position = max(0, scaled_pixmap.height() - self.label.height())
-
-                else:
-                    if self.scroll_position < max_scroll:
-                        self.scroll_position = min(max_scroll, self.scroll_position + scroll_step)
-                    elif self.scroll_position >= max_scroll and self.page_number < len(self.image_files):
-                        self.page_number += 1
-
-                        image_path = self.image_files[self.page_number - 1]
-                        image = cv2.imread(image_path)
-                        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-                        height, width, _ = image_rgb.shape
-                        q_image = QImage(image_rgb.data, width, height, 3 * width, QImage.Format.Format_RGB888)
-                        pixmap = QPixmap.fromImage(q_image)
-                        scaled_pixmap = pixmap.scaledToWidth(self.label.width(), Qt.TransformationMode.SmoothTransformation)
-
-
-                        self.scroll_position = 0
-
-
-                # Crop the image to simulate vertical scroll
-                cropped_pixmap = scaled_pixmap.copy(0, self.scroll_position, scaled_pixmap.width(), visible_height)
-                self.label.setPixmap(cropped_pixmap)
+                self.reading_direction = -1 if event.angleDelta().y() > 0 else 1
+                self.scroll_strip(scroll_step * self.reading_direction)
+                self.render_strip()
 
             else:
                 self.scroll_position = 0
                 if event.angleDelta().y() > 0 and self.page_number > 1:
                     self.page_number -= 1
+                    self.reading_direction = -1
                 elif event.angleDelta().y() < 0 and self.page_number < len(self.image_files):
                     self.page_number += 1
+                    self.reading_direction = 1
 
-                label_size = self.label.size()
-                scaled_pixmap = pixmap.scaled(label_size, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+                self.memory.set_position(self.page_number, self.reading_direction)
+                scaled_pixmap = self.page_cache.fit_page(self.page_number, self.label.size())
+                if scaled_pixmap is None:
+                    return
                 self.label.setPixmap(scaled_pixmap)
+                self.page_cache.prefetch(self.page_number, self.reading_direction, size=self.label.size())
 
             self.update_title()
 
@@ -510,38 +1452,66 @@ class ComicViewer(QMainWindow):
 
         self.save_last_session()
 
-        extract_dir = 'extracted_images'
-        if os.path.exists(extract_dir):
-            try:
-                shutil.rmtree(extract_dir)
-                print(f"Temporary directory '{extract_dir}' deleted.")
-            except Exception as e:
-                print(f"Error deleting temporary directory: {e}")
+        # Stop the timers first, their slots schedule work on the executors shut down below
+        self.zoom_prefetch_timer.stop()
+        self.resize_timer.stop()
+        self.stats_timer.stop()
+        self.detector.shutdown()
+        self.page_cache.shutdown()
+        self.thumbnails.shutdown()
+        self.store_panel_index()
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+        if self.trace_path:
+            self.write_trace(self.trace_path)
         event.accept()
 
-    def simulate_scroll_down(self, event=None):
-        wheel_event = QWheelEvent(
-            QPointF(0, 0),               # pos (QPointF)
-            QPointF(0, 0),               # globalPos (QPointF)
-            QPoint(0, 0),                # pixelDelta (QPoint)
-            QPoint(0, -120),             # angleDelta (QPoint) — negative for scroll down
-            Qt.MouseButton.NoButton,
-            Qt.KeyboardModifier.NoModifier,
-            Qt.ScrollPhase.ScrollUpdate,
-            False                        # inverted
-        )
-        QApplication.postEvent(self, wheel_event)
-
 
-if __name__ == "__main__":
-    app = QApplication(sys.argv)
-    viewer = ComicViewer()
+def launch(argv):
+    """Show the viewer for a command line, and open the book given on it once the event loop runs.
+
+    Returns (app, viewer) once the window has painted; the caller runs app.exec().
+    """
+    parser = argparse.ArgumentParser(prog="main.py", description="Comic book viewer.",
+                                     epilog="'main.py index DIR' pre-computes panel indexes for a library.")
+    parser.add_argument("path", nargs="?", default=None, help="CBZ/ZIP book to open")
+    parser.add_argument("--memory-budget-mb", type=int, default=None,
+                        help=f"memory for cached pages and panels (default: settings.json, else {DEFAULT_MEMORY_BUDGET_MB})")
+    args, qt_args = parser.parse_known_args(argv)
+    loader = ThreadPoolExecutor(max_workers=1)
+    path = os.path.abspath(args.path) if args.path else None
+    if path:
+        # OpenCV is imported and the central directory read while Qt starts and the window is built
+        archive = loader.submit(load_archive, path)
+
+    app = QApplication(sys.argv[:1] + qt_args)
+    viewer = ComicViewer(args.memory_budget_mb)
     # Set the initial size of the viewer to 80% of the screen size
     screen = QGuiApplication.primaryScreen().availableGeometry()
-    width = int(screen.width() * 0.8)
-    height = int(screen.height() * 0.8)
-    viewer = ComicViewer()
-    viewer.resize(width, height)
-
+    viewer.resize(int(screen.width() * 0.8), int(screen.height() * 0.8))
     viewer.show()
+    app.processEvents()
+
+    if path:
+        def open_book():
+            try:
+                viewer.open_path(path, archive=archive.result())
+            except Exception as e:
+                viewer.label.setText(f"Failed to open {os.path.basename(path)}: {e}")
+        QTimer.singleShot(0, open_book)
+    else:
+        # Nothing to show yet, have the imaging stack ready for the first book
+        loader.submit(warm_up_imaging)
+    loader.shutdown(wait=False)
+    return app, viewer
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1 and sys.argv[1] == "index":
+        # Headless library indexing, no window
+        from indexer import main as run_index_command
+        sys.exit(run_index_command(sys.argv[2:]))
+    app, viewer = launch(sys.argv[1:])
     sys.exit(app.exec())
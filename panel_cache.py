@@ -0,0 +1,105 @@
+import json
+import os
+
+from panel_index import DEFAULT_ENGINE
+
+
+def default_cache_dir(*parts):
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "panel_viewer", *parts)
+
+
+def _detector_version(engine):
+    # panels loads OpenCV, which the viewer only needs once a book is open
+    from panels import detector_version
+    return detector_version(engine)
+
+
+class PanelIndexCache:
+    """On-disk panel index, one JSON file per book.
+
+    Files are named by the archive content hash and detection engine and
+    hold, per page, the source page size and the sorted (x, y, w, h) boxes
+    in source pixels; a page that could not be decoded has size (0, 0) and
+    no boxes. The content hash covers every member CRC, so a book whose
+    pages changed gets a new file rather than a partly stale one. An index
+    written by a different detector version is ignored. The directory is
+    capped at max_bytes, evicting the least recently used books first (file
+    mtime is refreshed on every load).
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir or default_cache_dir("panels")
+        self.max_bytes = max_bytes
+
+    def path_for(self, archive, engine=DEFAULT_ENGINE):
+        return os.path.join(self.cache_dir, f"{archive.content_hash()}-{engine}.json")
+
+    def load(self, archive, engine=DEFAULT_ENGINE):
+        """Return {page_index: ((height, width), boxes)} for every valid cached page."""
+        path = self.path_for(archive, engine)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get("version") != _detector_version(engine):
+            return {}
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        pages = {}
+        for key, entry in data.get("pages", {}).items():
+            page_index = int(key)
+            if page_index >= len(archive):
+                continue
+            pages[page_index] = (tuple(entry["size"]), [tuple(box) for box in entry["boxes"]])
+        return pages
+
+    def store(self, archive, pages, engine=DEFAULT_ENGINE):
+        """Write {page_index: ((height, width), boxes)} for archive and enforce the size cap."""
+        data = {
+            "version": _detector_version(engine),
+            "archive": os.path.basename(archive.path),
+            "pages": {
+                str(page_index): {
+                    "size": list(size),
+                    "boxes": [list(box) for box in boxes],
+                }
+                for page_index, (size, boxes) in sorted(pages.items())
+            },
+        }
+        path = self.path_for(archive, engine)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write panel index: {e}")
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+                total -= size
+            except OSError:
+                pass
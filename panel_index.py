@@ -0,0 +1,119 @@
+"""Panel navigation and the names of the detection engines.
+
+Kept apart from the OpenCV detection code in panels.py, so the viewer can
+build its window and menus before OpenCV and NumPy are loaded.
+"""
+
+# "contour" follows the outline of every ink blob, "xycut" splits the page
+# recursively along white gutters found from row/column projections
+ENGINES = ("contour", "xycut")
+DEFAULT_ENGINE = "contour"
+
+
+class PanelRecord:
+    """Geometry of one panel: 1-based page and panel numbers and its box in source page pixels."""
+    __slots__ = ("page", "panel", "x", "y", "w", "h")
+
+    def __init__(self, page, panel, x, y, w, h):
+        self.page = page
+        self.panel = panel
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+
+    def __repr__(self):
+        return f"PanelRecord(page={self.page}, panel={self.panel}, box={(self.x, self.y, self.w, self.h)})"
+
+
+class PanelIndex:
+    """Panels of one book, per page, with constant-time navigation.
+
+    Positions are (page, panel) pairs, both 1-based. Pages are added in any
+    order as detection finishes; a page that has not been added yet is
+    pending and navigation stops in front of it rather than skipping it.
+    Pages known to have no panels are skipped through forward/backward
+    links with path compression, so every step is amortized O(1).
+    """
+
+    def __init__(self, page_count):
+        self.page_count = page_count
+        self.panel_count = 0
+        self.pending_count = page_count
+        # pages[p] is None while page p is pending, else its PanelRecords
+        self.pages = [None] * (page_count + 2)
+        # Sentinels 0 and page_count + 1 link to themselves
+        self._forward = list(range(page_count + 2))
+        self._backward = list(range(page_count + 2))
+
+    def add_page(self, page, boxes):
+        if self.pages[page] is not None:
+            return
+        self.pages[page] = [PanelRecord(page, panel_index + 1, *box) for panel_index, box in enumerate(boxes)]
+        self.pending_count -= 1
+        self.panel_count += len(boxes)
+        if not boxes:
+            self._forward[page] = page + 1
+            self._backward[page] = page - 1
+
+    @staticmethod
+    def _find(links, page):
+        root = page
+        while links[root] != root:
+            root = links[root]
+        while links[page] != root:
+            links[page], page = root, links[page]
+        return root
+
+    def is_pending(self, page):
+        return 1 <= page <= self.page_count and self.pages[page] is None
+
+    def panels_on(self, page):
+        if not 1 <= page <= self.page_count:
+            return []
+        return self.pages[page] or []
+
+    def get(self, page, panel):
+        panels = self.panels_on(page)
+        if 1 <= panel <= len(panels):
+            return panels[panel - 1]
+        return None
+
+    def first_stop(self, page):
+        """First page at or after page that is pending or has panels, page_count + 1 if none."""
+        return self._find(self._forward, max(1, page))
+
+    def last_stop(self, page):
+        """Last page at or before page that is pending or has panels, 0 if none."""
+        return self._find(self._backward, min(self.page_count, page))
+
+    def next(self, page, panel):
+        """Position after (page, panel), or None at the end or in front of a pending page."""
+        if panel < len(self.panels_on(page)):
+            return page, panel + 1
+        stop = self.first_stop(page + 1)
+        if stop > self.page_count or self.pages[stop] is None:
+            return None
+        return stop, 1
+
+    def previous(self, page, panel):
+        """Position before (page, panel), or None at the start or behind a pending page."""
+        if panel > 1 and self.get(page, panel - 1) is not None:
+            return page, panel - 1
+        stop = self.last_stop(page - 1)
+        if stop < 1 or self.pages[stop] is None:
+            return None
+        return stop, len(self.pages[stop])
+
+    def jump_to_page(self, page):
+        """First panel of page, or of the next page with panels; None if pending or past the end."""
+        stop = self.first_stop(page)
+        if stop > self.page_count or self.pages[stop] is None:
+            return None
+        return stop, 1
+
+    def last(self):
+        stop = self.last_stop(self.page_count)
+        if stop < 1 or self.pages[stop] is None:
+            return None
+        return stop, len(self.pages[stop])
@@ -0,0 +1,304 @@
+import hashlib
+import math
+
+import cv2
+import numpy as np
+
+from archive import ComicArchive
+from instrument import recorder
+from panel_index import DEFAULT_ENGINE
+
+# Detection parameters. Cached panel indexes are tagged with a fingerprint of
+# these, so changing any of them invalidates every stored index.
+DETECTOR_REVISION = 1
+# Longest side of the page as the original detector saw it. MIN_PANEL_AREA
+# and ROW_TOLERANCE are expressed at this size and scaled to the working size.
+MAX_DIM = 4000
+# Longest side of the working copy the viewer actually thresholds
+WORK_DIM = 1000
+WHITE_THRESHOLD = 240
+MIN_PANEL_AREA = 10000
+ROW_TOLERANCE = 30
+# Narrowest white band the XY-cut engine treats as a gutter
+MIN_GUTTER = 12
+
+# Pages decoded and detected together by one worker call
+BATCH_SIZE = 4
+
+
+def detector_version(engine=DEFAULT_ENGINE):
+    params = (DETECTOR_REVISION, engine, MAX_DIM, WORK_DIM, WHITE_THRESHOLD, MIN_PANEL_AREA, ROW_TOLERANCE,
+              MIN_GUTTER)
+    return hashlib.sha1(repr(params).encode()).hexdigest()[:16]
+
+
+def sort_panels(boxes, row_tolerance=ROW_TOLERANCE):
+    boxes = sorted(boxes, key=lambda b: b[1])
+    rows, current_row = [], []
+    for box in boxes:
+        if not current_row or abs(box[1] - current_row[0][1]) < row_tolerance:
+            current_row.append(box)
+        else:
+            rows.append(sorted(current_row, key=lambda b: b[0]))
+            current_row = [box]
+    if current_row:
+        rows.append(sorted(current_row, key=lambda b: b[0]))
+    return [box for row in rows for box in row]
+
+
+def working_gray(image, max_dim):
+    """Grayscale copy of image resized so its longest side is about max_dim."""
+    height, width = image.shape[:2]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    shrink = max(height, width) // max_dim
+    if shrink >= 2:
+        # Block-average by a whole factor: keeps thin gutters and is OpenCV's
+        # fast path, at the cost of landing between max_dim and 2 * max_dim
+        gray = cv2.resize(gray, None, fx=1 / shrink, fy=1 / shrink, interpolation=cv2.INTER_AREA)
+    else:
+        scale = max_dim / max(height, width)
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)))
+    return gray
+
+
+def detect_panels(image, max_dim=MAX_DIM):
+    """Find panel boxes on a copy of image resized so its longest side is max_dim.
+
+    Returns the resized grayscale working copy and the boxes, sorted in reading
+    order, in its coordinates.
+    """
+    with recorder.span("detect"):
+        gray, panel_boxes = _contour_boxes(image, max_dim)
+    dim_ratio = max(gray.shape) / MAX_DIM
+    with recorder.span("sort"):
+        boxes = sort_panels(panel_boxes, ROW_TOLERANCE * dim_ratio)
+    return gray, boxes
+
+
+def _contour_boxes(image, max_dim):
+    gray = working_gray(image, max_dim)
+    dim_ratio = max(gray.shape) / MAX_DIM
+
+    _, inverted = cv2.threshold(gray, WHITE_THRESHOLD, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(inverted, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    panel_boxes = []
+    for cnt in contours:
+        x, y, w, h = cv2.boundingRect(cnt)
+        if w * h > MIN_PANEL_AREA * dim_ratio * dim_ratio:
+            panel_boxes.append((x, y, w, h))
+    return gray, panel_boxes
+
+
+def contour_pages_boxes(grays):
+    """Boxes of the outer ink blobs of several grayscale working copies, from one threshold and contour pass.
+
+    The pages are stacked into one image, each with a blank row under it and
+    padded white to the widest, so blobs never join across pages. Bounding
+    boxes of all the contours are taken and filtered by area as whole arrays.
+    """
+    heights = np.array([gray.shape[0] for gray in grays])
+    tops = np.concatenate(([0], np.cumsum(heights + 1)[:-1]))
+    canvas = np.full((int(heights.sum()) + len(grays), max(gray.shape[1] for gray in grays)), 255, np.uint8)
+    for gray, top in zip(grays, tops):
+        canvas[top:top + gray.shape[0], :gray.shape[1]] = gray
+    _, ink = cv2.threshold(canvas, WHITE_THRESHOLD, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(ink, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    results = [[] for _ in grays]
+    if not contours:
+        return results
+
+    # Corners of every contour at once, as boundingRect would give them
+    points = np.concatenate(contours)[:, 0]
+    starts = np.concatenate(([0], np.cumsum(np.fromiter(map(len, contours), int, len(contours)))[:-1]))
+    x, y = np.minimum.reduceat(points, starts).T
+    w, h = (np.maximum.reduceat(points, starts) + 1).T - (x, y)
+    page = np.searchsorted(tops, y, side="right") - 1
+    dim_ratio = np.array([max(gray.shape) / MAX_DIM for gray in grays])
+    keep = w * h > MIN_PANEL_AREA * dim_ratio[page] ** 2
+    page = page[keep]
+    boxes = np.column_stack((x[keep], y[keep] - tops[page], w[keep], h[keep]))
+    for page_index, box in zip(page.tolist(), boxes.tolist()):
+        results[page_index].append(tuple(box))
+    return results
+
+
+def _gutter_runs(empty, min_length):
+    """Start and end indexes of the runs of True in empty at least min_length long."""
+    padded = np.concatenate(([False], empty, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[0::2], edges[1::2]
+    keep = ends - starts >= min_length
+    return starts[keep], ends[keep]
+
+
+def _xycut(ink, y0, y1, x0, x1, min_gutter, min_area, boxes):
+    region = ink[y0:y1, x0:x1]
+    rows = region.any(axis=1)
+    ys = np.flatnonzero(rows)
+    if not len(ys):
+        return
+    xs = np.flatnonzero(region.any(axis=0))
+    # Trim the white margin around the region
+    y0, y1 = y0 + ys[0], y0 + ys[-1] + 1
+    x0, x1 = x0 + xs[0], x0 + xs[-1] + 1
+    rows = rows[ys[0]:ys[-1] + 1]
+    cols = region[ys[0]:ys[-1] + 1].any(axis=0)[xs[0]:xs[-1] + 1]
+
+    # Rows first so bands are read top to bottom, then columns left to right
+    for profile, horizontal in ((rows, True), (cols, False)):
+        starts, ends = _gutter_runs(~profile, min_gutter)
+        if not len(starts):
+            continue
+        bounds = np.concatenate(([0], np.column_stack((starts, ends)).ravel(), [len(profile)]))
+        for start, end in zip(bounds[0::2], bounds[1::2]):
+            if horizontal:
+                _xycut(ink, y0 + start, y0 + end, x0, x1, min_gutter, min_area, boxes)
+            else:
+                _xycut(ink, y0, y1, x0 + start, x0 + end, min_gutter, min_area, boxes)
+        return
+
+    if (x1 - x0) * (y1 - y0) > min_area:
+        boxes.append((int(x0), int(y0), int(x1 - x0), int(y1 - y0)))
+
+
+def xycut_panels(ink):
+    """Split a boolean ink mask (True where the page is not white) into panel boxes, in reading order."""
+    dim_ratio = max(ink.shape) / MAX_DIM
+    boxes = []
+    _xycut(ink, 0, ink.shape[0], 0, ink.shape[1], max(1, round(MIN_GUTTER * dim_ratio)),
+           MIN_PANEL_AREA * dim_ratio * dim_ratio, boxes)
+    return boxes
+
+
+def detect_pages_boxes(images, max_dim=WORK_DIM, engine=DEFAULT_ENGINE):
+    """Detect panels on several pages at once, boxes in each page's own pixels.
+
+    The contour engine thresholds and traces all the pages as one stacked
+    image; the XY-cut engine thresholds each group of same-size pages as one
+    stacked array. Entries of images may be None, which gives an empty box
+    list.
+    """
+    results = [[] for _ in images]
+    if engine == "contour":
+        indexes = [i for i, image in enumerate(images) if image is not None]
+        if not indexes:
+            return results
+        with recorder.span("detect"):
+            grays = [working_gray(images[i], max_dim) for i in indexes]
+            page_boxes = contour_pages_boxes(grays)
+        with recorder.span("sort"):
+            page_boxes = [sort_panels(boxes, ROW_TOLERANCE * max(gray.shape) / MAX_DIM)
+                          for gray, boxes in zip(grays, page_boxes)]
+        for i, gray, boxes in zip(indexes, grays, page_boxes):
+            results[i] = to_source_boxes(boxes, gray.shape, images[i].shape)
+        return results
+
+    groups = {}
+    for i, image in enumerate(images):
+        if image is not None:
+            groups.setdefault(image.shape[:2], []).append(i)
+    for source_shape, indexes in groups.items():
+        with recorder.span("detect"):
+            stack = np.stack([working_gray(images[i], max_dim) for i in indexes])
+            ink = stack <= WHITE_THRESHOLD
+            page_boxes = [xycut_panels(page_ink) for page_ink in ink]
+        for i, boxes in zip(indexes, page_boxes):
+            results[i] = to_source_boxes(boxes, stack.shape[1:], source_shape)
+    return results
+
+
+def detect_page_boxes(image, max_dim=WORK_DIM, engine=DEFAULT_ENGINE):
+    """Detect panels on a max_dim working copy and map the boxes back to image's own pixels.
+
+    Crops are then taken from the original pixels, so the working copy only
+    needs to be large enough to resolve the gutters.
+    """
+    return detect_pages_boxes([image], max_dim, engine)[0]
+
+
+def to_source_boxes(boxes, working_shape, source_shape):
+    height, width = source_shape[:2]
+    scale_x = working_shape[1] / width
+    scale_y = working_shape[0] / height
+    source_boxes = []
+    for x, y, w, h in boxes:
+        x0, y0 = int(x / scale_x), int(y / scale_y)
+        x1 = min(width, math.ceil((x + w) / scale_x))
+        y1 = min(height, math.ceil((y + h) / scale_y))
+        source_boxes.append((x0, y0, x1 - x0, y1 - y0))
+    return source_boxes
+
+
+def crop_panel(image, record, scale, page_size=None):
+    """Cut record's box out of image, scaled to scale times its size in source pixels.
+
+    page_size is the (height, width) the box refers to, when image was
+    decoded at a reduced size. Shrinking by 2x or more averages pixels,
+    milder shrinking is linear (INTER_AREA is slow at fractional ratios) and
+    enlarging is cubic.
+    """
+    x, y, w, h = record.x, record.y, record.w, record.h
+    if page_size is not None and page_size[1] != image.shape[1]:
+        sx = image.shape[1] / page_size[1]
+        sy = image.shape[0] / page_size[0]
+        x, y = int(x * sx), int(y * sy)
+        w, h = max(1, round(w * sx)), max(1, round(h * sy))
+    panel = image[y:y+h, x:x+w]
+    size = (max(1, round(record.w * scale)), max(1, round(record.h * scale)))
+    if size[0] * 2 <= panel.shape[1]:
+        interpolation = cv2.INTER_AREA
+    elif size[0] < panel.shape[1]:
+        interpolation = cv2.INTER_LINEAR
+    else:
+        interpolation = cv2.INTER_CUBIC
+    with recorder.span("crop"):
+        return cv2.resize(panel, size, interpolation=interpolation)
+
+
+# Archive opened by this worker process, reused across pages of the same book
+_worker_archive = None
+
+
+def _open_worker_archive(zip_path):
+    global _worker_archive
+    if _worker_archive is None or _worker_archive.path != zip_path:
+        if _worker_archive is not None:
+            _worker_archive.close()
+        _worker_archive = ComicArchive(zip_path)
+    return _worker_archive
+
+
+def _decode_page(archive, page_index):
+    try:
+        return archive.decode(page_index)
+    except Exception as e:
+        print(f"Failed to decode page {page_index + 1} of {archive.path}: {e}")
+        return None
+
+
+def detect_archive_pages(archive, page_indexes, engine=DEFAULT_ENGINE):
+    """Decode and detect some pages of an open archive together.
+
+    Returns a list of (page_index, (height, width), boxes) with boxes in
+    source page pixels. Size is None and boxes empty if a page could not be
+    decoded, so one broken member does not fail the pages batched with it.
+    """
+    images = [_decode_page(archive, page_index) for page_index in page_indexes]
+    boxes = detect_pages_boxes(images, engine=engine)
+    return [(page_index, image.shape[:2] if image is not None else None, page_boxes)
+            for page_index, image, page_boxes in zip(page_indexes, images, boxes)]
+
+
+def process_book(archive, page_indexes=None, engine=DEFAULT_ENGINE, batch_size=BATCH_SIZE):
+    """Detect the panels of a whole book (or the given pages), yielding each batch of results as it finishes."""
+    if page_indexes is None:
+        page_indexes = range(len(archive))
+    page_indexes = list(page_indexes)
+    for start in range(0, len(page_indexes), batch_size):
+        yield detect_archive_pages(archive, page_indexes[start:start + batch_size], engine)
+
+
+def process_pages(zip_path, page_indexes, engine=DEFAULT_ENGINE):
+    """detect_archive_pages for a worker process, which keeps the archive open between calls."""
+    return detect_archive_pages(_open_worker_archive(zip_path), page_indexes, engine)
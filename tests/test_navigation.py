@@ -0,0 +1,41 @@
+"""Panel navigation in the viewer window, run on the offscreen Qt platform."""
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("PyQt6")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from PyQt6.QtCore import QPoint, QPointF, Qt  # noqa: E402
+from PyQt6.QtGui import QWheelEvent  # noqa: E402
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def viewer(tmp_path, monkeypatch):
+    # The viewer keeps its settings and session in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    app = QApplication.instance() or QApplication([])
+    viewer = main.ComicViewer()
+    yield viewer
+    viewer.close()
+    app.processEvents()
+
+
+def test_panel_navigation_without_a_book(viewer):
+    viewer.reading_menu_panel_action.trigger()
+    for step in (viewer.show_next_panel, viewer.show_previous_panel, viewer.show_first_panel,
+                 viewer.show_last_panel, viewer.display_panel):
+        step()
+    for delta in (-120, 120):
+        event = QWheelEvent(QPointF(10, 10), QPointF(10, 10), QPoint(0, 0), QPoint(0, delta),
+                            Qt.MouseButton.NoButton, Qt.KeyboardModifier.NoModifier,
+                            Qt.ScrollPhase.NoScrollPhase, False)
+        viewer.wheelEvent(event)
+    assert viewer.archive is None
+    assert (viewer.page_number, viewer.panel_number) == (0, 1)
@@ -0,0 +1,125 @@
+import os
+
+from panel_cache import default_cache_dir
+
+# Height of the page thumbnails in the overview grid
+THUMBNAIL_HEIGHT = 240
+THUMBNAIL_QUALITY = 85
+
+
+class ThumbnailCache:
+    """On-disk page thumbnails as small JPEGs.
+
+    Each book gets a directory named by the archive content hash, holding
+    one file per page named by the member CRC and thumbnail height, so an
+    edited page gets a new thumbnail and identical pages share one. The
+    cache is capped at max_bytes, evicting the least recently opened books
+    first (the directory mtime is refreshed by touch()).
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir or default_cache_dir("thumbnails")
+        self.max_bytes = max_bytes
+
+    def book_dir(self, archive):
+        return os.path.join(self.cache_dir, archive.content_hash())
+
+    def path_for(self, archive, index, height=THUMBNAIL_HEIGHT, book_dir=None):
+        return os.path.join(book_dir or self.book_dir(archive), f"{archive.crc(index):08x}-{height}.jpg")
+
+    def touch(self, archive):
+        try:
+            os.makedirs(self.book_dir(archive), exist_ok=True)
+            os.utime(self.book_dir(archive))
+        except OSError:
+            pass
+
+    def evict(self):
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        books = []
+        for name in names:
+            book_dir = os.path.join(self.cache_dir, name)
+            try:
+                size = sum(entry.stat().st_size for entry in os.scandir(book_dir) if entry.is_file())
+                books.append((os.stat(book_dir).st_mtime, size, book_dir))
+            except OSError:
+                continue
+
+        total = sum(size for _, size, _ in books)
+        for _, size, book_dir in sorted(books):
+            if total <= self.max_bytes:
+                break
+            for entry in os.scandir(book_dir):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            try:
+                os.rmdir(book_dir)
+            except OSError:
+                pass
+            total -= size
+
+
+def make_thumbnail(archive, index, height=THUMBNAIL_HEIGHT):
+    """JPEG bytes of page index scaled to height, decoded at the coarsest reduction that covers it."""
+    # Only workers make thumbnails; the viewer imports this module before OpenCV
+    import cv2
+
+    from archive import reduction_for_scale
+
+    page_height, _ = archive.page_size(index)
+    image = archive.decode_reduced(index, reduction_for_scale(height / page_height if page_height else 1.0))
+    if image is None:
+        return None
+    width = max(1, round(image.shape[1] * height / image.shape[0]))
+    interpolation = cv2.INTER_AREA if image.shape[0] > height else cv2.INTER_LINEAR
+    thumbnail = cv2.resize(image, (width, height), interpolation=interpolation)
+    ok, encoded = cv2.imencode(".jpg", thumbnail, [cv2.IMWRITE_JPEG_QUALITY, THUMBNAIL_QUALITY])
+    return encoded.tobytes() if ok else None
+
+
+def thumbnail_pages(zip_path, pages, height=THUMBNAIL_HEIGHT):
+    """Worker entry point: JPEG bytes for each (page_index, cache path), made and stored if not cached.
+
+    Returns a list of (page_index, bytes or None).
+    """
+    from archive import ComicArchive
+
+    results = []
+    with ComicArchive(zip_path) as archive:
+        for page_index, path in pages:
+            try:
+                with open(path, "rb") as f:
+                    results.append((page_index, f.read()))
+                continue
+            except OSError:
+                pass
+            try:
+                data = make_thumbnail(archive, page_index, height)
+            except Exception as e:
+                print(f"Thumbnail of page {page_index + 1} failed: {e}")
+                data = None
+            if data is not None:
+                try:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    tmp_path = path + ".tmp"
+                    with open(tmp_path, "wb") as f:
+                        f.write(data)
+                    os.replace(tmp_path, path)
+                except OSError:
+                    pass
+            results.append((page_index, data))
+    return results
+
+
+def lower_priority():
+    """Process pool initializer: run thumbnail workers behind everything else."""
+    if hasattr(os, "nice"):
+        try:
+            os.nice(10)
+        except OSError:
+            pass